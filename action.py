@@ -26,22 +26,103 @@ class ActionInputError(Exception):
     pass
 
 
-def act(arguments, actions):
+class Inject:
+    """Placeholder for an argument of an action that is only known when the action is executed.
+
+    Parameters
+    ----------
+    name : str
+        Name of the keyword argument of `act` that provides the value.
+
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Inject({0!r})'.format(self.name)
+
+
+class ActionTable:
+    """Actions compiled into a trie over the lower-cased arguments.
+
+    Each level of the trie is stored in a flat dictionary from the argument to the index of the next
+    level, so that finding the action for a list of arguments takes one lookup per argument.
+
+    Attributes
+    ----------
+    children : list of dict
+        Dictionary from the argument to the index of the next level, for each level.
+    errors : list of str
+        Message that is raised when a bad argument is given, for each level.
+    leaves : dict
+        Dictionary from the index of the level to the tuple of the documentation, function, and
+        default arguments of the action (or to the message of the action, if the action is a
+        string).
+
+    """
+    def __init__(self, actions):
+        self.children = []
+        self.errors = []
+        self.leaves = {}
+        self._add(actions)
+
+    def _add(self, actions):
+        """Add the given actions as a new level and return its index."""
+        index = len(self.children)
+        self.children.append({})
+        self.errors.append(None)
+        if isinstance(actions, (tuple, list)):
+            doc, func = actions[:2]
+            if not isinstance(doc, str):
+                # FIXME: wording
+                raise ValueError('First entry in the list of actions must be the documentation for '
+                                 'executing the function.')
+            elif not hasattr(func, '__call__'):
+                # FIXME: wording
+                raise ValueError('Second entry in the list of actions must be the executed '
+                                 'function.')
+            self.leaves[index] = (doc, func, tuple(actions[2:]))
+        elif isinstance(actions, str):
+            self.leaves[index] = actions
+        elif isinstance(actions, dict):
+            if 'error' not in actions:
+                raise ValueError('The provided set of actions must contain the key `error` to '
+                                 'handle behaviour when bad arguments are provided:\n{0}'
+                                 ''.format(actions))
+            self.errors[index] = actions['error']
+            for key, inner_actions in actions.items():
+                if key is None:
+                    self.children[index][None] = self._add(inner_actions)
+                elif key != 'error':
+                    self.children[index][key.lower()] = self._add(inner_actions)
+        else:
+            # FIXME: wording
+            raise ValueError('Cannot understand the given structure of actions.')
+        return index
+
+
+def act(arguments, actions, **context):
     """Executes appropriate actions given the string arguments.
 
     Parameters
     ----------
     arguments : list of str
         Arguments provided by the user.
-    actions : dict
+    actions : {dict, ActionTable}
         Actions that corresponds to the given arguments.
         Dictionary where the keys are the arguments provided by the user and the values are the
         actions that corresponds to the arguments.
         If multiple arguments are required to trigger an action, the dictionary can be nested for
         additional arguments.
+        The key None matches any other argument (or no argument), which is then passed on to its
+        action.
         The values are the action that will be executed. It will be a function that requires no
         arguments (this function will be executed without arguments).
         Each level of action must contain an error key that handles the action upon bad input.
+        The dictionary is compiled into an ActionTable on every call, so actions that are used
+        repeatedly should be compiled once beforehand.
+    context : dict
+        Values of the arguments of the actions that are marked with `Inject`.
 
     Raises
     ------
@@ -49,36 +130,33 @@ def act(arguments, actions):
         If the given actions does not contain the key 'error'.
 
     """
-    try:
-        contents = actions[arguments[0].lower()]
-        # here, IndexError is raised if arguments is empty
-        # then, KeyError is raised if given argument is not a key in actions
-    except (KeyError, IndexError):
-        if 'error' not in actions:
-            raise ValueError('The provided set of actions must contain the key `error` to handle '
-                             'behaviour when bad arguments are provided:\n{0}'.format(actions))
-        raise ActionInputError(actions['error'])
-
-    if isinstance(contents, (tuple, list)):
-        doc, func = contents[:2]
-        default_args = contents[2:]
-        if not isinstance(doc, str):
-            # FIXME: wording
-            raise ValueError('First entry in the list of actions must be the documentation for '
-                             'executing the function.')
-        elif not hasattr(func, '__call__'):
-            # FIXME: wording
-            raise ValueError('Second entry in the list of actions must be the executed function.')
+    if not isinstance(actions, ActionTable):
+        actions = ActionTable(actions)
+
+    index = 0
+    depth = 0
+    while index not in actions.leaves:
+        children = actions.children[index]
         try:
-            args = default_args + arguments[1:]
-            func(*args)
-            # TypeError is raised if wrong number of arguments are provided to the method
-        except TypeError:
-            raise ActionInputError(doc)
-    elif isinstance(contents, str):
+            index = children[arguments[depth].lower()]
+            # here, IndexError is raised if arguments is empty
+            # then, KeyError is raised if given argument is not a key in actions
+        except (KeyError, IndexError):
+            if None not in children:
+                raise ActionInputError(actions.errors[index])
+            # the argument is left for the action under the key None
+            index = children[None]
+        else:
+            depth += 1
+
+    contents = actions.leaves[index]
+    if isinstance(contents, str):
         raise ActionInputError(contents)
-    elif isinstance(contents, dict):
-        act(arguments[1:], contents)
-    else:
-        # FIXME: wording
-        raise ValueError('Cannot understand the given structure of actions.')
+
+    doc, func, default_args = contents
+    args = [context[i.name] if isinstance(i, Inject) else i for i in default_args]
+    try:
+        func(*(args + list(arguments[depth:])))
+        # TypeError is raised if wrong number of arguments are provided to the method
+    except TypeError:
+        raise ActionInputError(doc)
@@ -7,3 +7,5 @@ from . import timed_action
 from . import interactive_action
 from . import members
 from . import group_meeting
+from . import matcher
+from . import conversation
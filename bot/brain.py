@@ -49,13 +49,19 @@ can be nested (Take first inputs for organization, then inputs for the function)
 """
 import shlex
 import sqlite3
+import threading
+import schema
+from outbox import Outbox
+from channel_directory import ChannelDirectory
 from . import ear
 from . import mouth
 from .action import BadInput, Messaging
-from .timed_action import TimedAction
+from .timed_action import Scheduler, TimedAction, TimedActionStore
 from .interactive_action import InteractiveAction
 from .members import GroupMember
 from .group_meeting import GroupMeeting
+from .matcher import Matcher
+from .conversation import ConversationStore
 from .utils import nice_options
 
 class Brain(object):
@@ -67,49 +73,127 @@ class Brain(object):
         User name of bot within Slack client
     slack_client : slack.SlackClient
         Slack client within which bot lives
+    outbox : outbox.Outbox
+        Queue through which the messages of the bot are sent
+    channels : channel_directory.ChannelDirectory
+        Channels that the bot can see
+        Kept up to date with the RTM events that are given to `listen`
     actions : dict
         Dictionary of action names to instances of Action
-    timed_actions : dict
-        Dictionary of (instance of Action, option, inputs, interval) to last time
-        process has run
-        Stores processes that will be repeated in some time interval
-    commands : dict
-        Dictionary of channel to (userid, last input, time)
+        Assigning it rebuilds `matcher`
+    matcher : matcher.Matcher
+        Finds the names of the actions, their options, and the control words in a command
+    scheduler : timed_action.Scheduler
+        Scheduler of the processes that will be repeated in some time interval
+        Each job is keyed by (name of action, option, inputs, interval)
+    timed_action_store : timed_action.TimedActionStore
+        Table in the database in which the timed actions are kept across restarts
+    db_lock : threading.RLock
+        Lock that is held while an action runs
+        The actions share one connection and cursor, so the commands and the timed actions, which
+        run on the workers of the scheduler, must not use them at the same time
+    commands : conversation.ConversationStore
+        Inputs of the commands that are being given, by (channel, user)
+        Each user in a channel can give a command over several messages at the same time
+    conversations : conversation.ConversationStore
+        Responses of the conversations that the bot started, by (channel, label)
 
     """
-    def __init__(self, bot_id, slack_client, status_channel):
+    def __init__(self, bot_id, slack_client, status_channel, channels=None):
+        """
+        Parameters
+        ----------
+        bot_id : str
+            User name of bot within Slack client
+        slack_client : slack.SlackClient
+            Slack client within which bot lives
+        status_channel : str
+            Channel to which the messages of the timed actions are sent
+        channels : channel_directory.ChannelDirectory
+            Channels that the bot can see, so that one directory can be shared with the rest of
+            the bot
+            Default is a new directory
+        """
         self.bot_id = bot_id
         self.slack_client = slack_client
-        self.db_conn = sqlite3.connect('ayerslab.db')
+        self.outbox = Outbox(slack_client)
+        if channels is None:
+            channels = ChannelDirectory(slack_client)
+        self.channels = channels
+        # timed actions use the database from the workers of the scheduler
+        self.db_conn = sqlite3.connect('ayerslab.db', check_same_thread=False)
+        schema.migrate(self.db_conn)
         self.cursor = self.db_conn.cursor()
+        self.db_lock = threading.RLock()
+        self._conversation_matchers = {}
         self.actions = {i.name:i for i in [GroupMember(self, self.db_conn),
                                            TimedAction(self),
                                            InteractiveAction(self),
                                            GroupMeeting(self.db_conn),]}
 
-        # FIXME: move this to TimedActions
-        self.timed_actions = {}
-        self.commands = {}
-        self.conversations = {}
+        self.timed_action_store = TimedActionStore('ayerslab.db')
+        self.scheduler = Scheduler(on_error=self._report_timed_action,
+                                   on_done=self._save_timed_action)
+        self.commands = ConversationStore(ttl=60)
+        self.conversations = ConversationStore(ttl=60)
         self.status_channel = status_channel
+        self.load_timed_actions()
+
+    # words that end the conversation
+    enders = ('forget', 'reset', 'fuck', 'shut up', 'stop', 'bye')
+
+    @property
+    def actions(self):
+        """ Dictionary of action names to instances of Action
+        """
+        return self._actions
+
+    @actions.setter
+    def actions(self, actions):
+        self._actions = actions
+        self.compile_matcher()
+
+    def compile_matcher(self):
+        """ Builds the matcher of the words that the commands are made of
+
+        Each keyword is given back with a list of what it stands for: ('action', action name),
+        ('option', action name, option), ('ender', ), ('status', ), or ('undo', )
+        """
+        keywords = {}
+        for name, action in self.actions.items():
+            keywords.setdefault(name, []).append(('action', name))
+            for option in action.options:
+                keywords.setdefault(option, []).append(('option', name, option))
+        for ender in self.enders:
+            keywords.setdefault(ender, []).append(('ender', ))
+        keywords.setdefault('status', []).append(('status', ))
+        keywords.setdefault('undo', []).append(('undo', ))
+        self.matcher = Matcher(keywords)
+
+    @staticmethod
+    def _find(matches, label, start=0):
+        """ Returns the matches that stand for the given label and begin at or after the start
+        """
+        return [(i, j, kwrd, tag) for i, j, kwrd, tags in matches if i >= start
+                for tag in tags if tag[:len(label)] == label]
 
     @property
     def public_channels(self):
         """ Dictionary of public channels name to id
         """
-        return {i['name']:i['id'] for i in self.slack_client.api_call("channels.list")['channels']}
+        return self.channels.public_channels
 
     @property
     def private_channels(self):
         """ Dictionary of private channels name to id
         """
-        return {i['name']:i['id'] for i in self.slack_client.api_call("groups.list")['groups']}
+        return self.channels.private_channels
 
     @property
     def dm_channels(self):
         """ Dictionary of direct message channels user id to channel id
         """
-        return {i['user']:i['id'] for i in self.slack_client.api_call("im.list")['ims']}
+        return self.channels.dm_channels
 
     @property
     def call_name(self):
@@ -125,6 +209,7 @@ class Brain(object):
         ----------
         slack_rtm_output : list of dict
             Real time output from Slack client
+            Events about the channels are given to `channels`
 
         Returns
         -------
@@ -133,7 +218,10 @@ class Brain(object):
         message : str
             Direct message
         """
-        return ear.listen(self, slack_rtm_output, sound_type=sound_type)
+        sound = ear.listen(self, slack_rtm_output, sound_type=sound_type)
+        for event in slack_rtm_output:
+            self.channels.handle_event(event)
+        return sound
 
     def speak(self, channel, response, dm=''):
         """ Sends information to Slack client
@@ -148,26 +236,48 @@ class Brain(object):
         """
         mouth.speak(self, channel, response, dm=dm)
 
-    def _process_step1(self, command):
+    def _process_step1(self, matches):
         """ Checks to see if given command uses provides an allowed action
+
+        Parameters
+        ----------
+        matches : list
+            Matches of `matcher` in the command
+
+        Returns
+        -------
+        (True, match) if an action is found, where match is the first one of them
+        (False, message) if not
         """
-        sel_actions = [name for name in self.actions if name in command]
+        sel_actions = self._find(matches, ('action', ))
         if len(sel_actions) == 0:
             message = ('I can only do one of {0}.'
                        ''.format(nice_options(self.actions.keys())))
             return (False, message)
-        # reorder actions
-        sel_actions = sorted(sel_actions, key=command.index)
         return (True, sel_actions[0])
 
-    def _process_step2(self, action, command):
+    def _process_step2(self, action, matches, start=0):
         """ Checks if the option corresponds with the action
+
+        Parameters
+        ----------
+        action : Action
+            Action that is selected
+        matches : list
+            Matches of `matcher` in the command
+        start : int
+            Position in the command after which the option is searched
+
+        Returns
+        -------
+        (True, match) if exactly one option is found, where match is its first occurrence
+        (False, message) if not
         """
-        options = [i for i in action.options if i in command]
+        options = self._find(matches, ('option', action.name), start=start)
         if len(options) == 0:
             message = action.init_response
             return (False, message)
-        elif len(options) >= 2:
+        elif len(set(match[2] for match in options)) >= 2:
             message = 'I have more than one valid options.'
             message += '\nPlease give me only one of {0}.'.format(action.options)
             return (False, message)
@@ -193,68 +303,53 @@ class Brain(object):
             False if message is not explicitly directed at bot
         """
         time = float(time)
+        key = (channel, user)
+        conversation = self.commands.get(key, time)
         # which messages should i skip?
-        if not dm:
-            # if not direct message and I'm not conversing with anyone in the given channel
-            # skip
-            if channel not in self.commands:
-                return
+        if conversation is None:
             # if not direct message and I'm not conversing with the person that messaged
             # skip
-            if self.commands[channel][0] not in ['', user]:
-                return
-            # NOTE: conversation with user '' means that the conversation is with
-            #       everyone in channel
-        # if direct message and I'm conversing with someone
-        elif channel in self.commands and abs(time - self.commands[channel][1]) <= 60:
-            # if I'm already conversing with someone else, skip
-            if self.commands[channel][0] != user:
-                self.speak(channel,
-                           "I'm sorry, I'm currently talking with <@{0}> at the moment."
-                           "".format(self.commands[channel][0]),
-                           dm=user)
+            if not dm:
                 return
-        # if direct message and I'm not conversing with anyone
-        else:
-            # start new conversation
-            self.commands[channel] = (user, time)
-        # so I'm currently conversing with someone right now
+            # if direct message and I'm not conversing with the person, start new conversation
+            conversation = self.commands.set(key, (), time)
+        # so I'm currently conversing with the person right now
 
+        matches = self.matcher.find_all(command)
         # end conversation
-        enders = ['forget', 'reset', 'fuck', 'shut up', 'stop', 'forget', 'bye']
-        for ender in enders:
-            if ender in command:
-                del self.commands[channel]
-                self.speak(channel, 'Alright then.', dm=user)
-                return
+        if self._find(matches, ('ender', )):
+            self.commands.pop(key)
+            self.speak(channel, 'Alright then.', dm=user)
+            return
         # check
-        if 'status' in command:
+        if self._find(matches, ('status', )):
             self.speak(channel,
-                       'Bleep bloop\n{0}'.format(' '.join(self.commands[channel][2:])),
+                       'Bleep bloop\n{0}'.format(' '.join(conversation.inputs)),
                        dm=user)
             return
         # undo
-        if 'undo' in command:
+        if self._find(matches, ('undo', )):
             self.speak(channel, 'Undoing the last input.')
-            self.commands[channel] = self.commands[channel][:-1]
+            self.commands.set(key, conversation.inputs[:-1], time)
             return
 
         # remember old conversation
-        old_conv = self.commands[channel][2:]
+        old_conv = conversation.inputs
 
         # find actions in command
         action_name = ''
+        # position in the command after which the rest of the command is read
+        start = 0
         if len(old_conv) >= 1:
             action_name = old_conv[0]
         else:
-            step1 = self._process_step1(command)
+            step1 = self._process_step1(matches)
             # if nothing found
             if not step1[0]:
                 self.speak(channel, step1[1], dm=user)
                 return
-            action_name = step1[1]
-            self.commands[channel] = (user, time, action_name)
-            command = command.split(action_name, 1)[1]
+            start, action_name = step1[1][1], step1[1][3][1]
+            self.commands.set(key, (action_name, ), time)
 
         # find option in command
         action = self.actions[action_name]
@@ -262,17 +357,16 @@ class Brain(object):
         if len(old_conv) >= 2:
             option = old_conv[1]
         else:
-            step2 = self._process_step2(action, command)
+            step2 = self._process_step2(action, matches, start=start)
             # if nothing found
             if not step2[0]:
                 self.speak(channel, step2[1], dm=user)
                 return
-            option = step2[1]
-            command = command.split(option, 1)[1]
-            self.commands[channel] = (user, time, action_name, option)
+            start, option = step2[1][1], step2[1][2]
+            self.commands.set(key, (action_name, option), time)
 
         # find parameters
-        command = command.strip()
+        command = command[start:].strip()
         parameters = old_conv[2:]
         if len(command) > 2 and command[0] in ["'", '"'] and command[-1] == command[0]:
             parameters += tuple(shlex.split(command[1:-1]))
@@ -281,34 +375,86 @@ class Brain(object):
 
         # act
         try:
-            action.options[option](*parameters)
+            with self.db_lock:
+                action.options[option](*parameters)
             self.speak(channel, 'Done!')
-            del self.commands[channel]
+            self.commands.pop(key)
         except BadInput as handler:
             self.speak(channel, handler.message)
-            self.commands[channel] = self.commands[channel][:4] + handler.args
+            self.commands.set(key, (action_name, option) + tuple(handler.args), time)
         except Messaging as handler:
             self.speak(channel, handler.message)
-            del self.commands[channel]
+            self.commands.pop(key)
 
-    def timed_process(self, time):
-        """ Runs stored commands every few seconds
+    def add_timed_action(self, key, next_time=None, last_time=None):
+        """ Repeats a command in some time interval
 
         Parameters
         ----------
-        time : int
-            Current time
+        key : tuple
+            Name of action, option, inputs, and interval (in seconds) of the command
+        next_time : float
+            Time at which the command is run next
+            Default is one interval after the last time
+        last_time : float
+            Time at which the command last ran
+        """
+        interval = key[3]
+        if next_time is None and last_time is not None:
+            next_time = last_time + interval
+        job = self.scheduler.add(key, lambda: self.run_timed_action(key), interval,
+                                 next_time=next_time, last_time=last_time)
+        self._save_timed_action(job)
+
+    def remove_timed_action(self, key):
+        """ Stops repeating a command
+
+        Parameters
+        ----------
+        key : tuple
+            Name of action, option, inputs, and interval (in seconds) of the command
+        """
+        self.scheduler.remove(key)
+        self.timed_action_store.delete(key)
+
+    def load_timed_actions(self):
+        """ Schedules the timed actions that are stored in the database
+
+        Timed actions that were due while the bot was down are run right away
+        """
+        for key, last_time, next_time in self.timed_action_store.load():
+            if key[0] not in self.actions:
+                continue
+            self.scheduler.add(key, lambda key=key: self.run_timed_action(key), key[3],
+                               next_time=next_time, last_time=last_time)
+
+    def _save_timed_action(self, job):
+        """ Stores the schedule of a timed action in the database
+        """
+        self.timed_action_store.save(job.key, job.last_time, job.next_time)
+
+    def run_timed_action(self, key):
+        """ Runs a command that is repeated in some time interval
+
+        Messages of the command are sent to the status channel
+
+        Parameters
+        ----------
+        key : tuple
+            Name of action, option, inputs, and interval (in seconds) of the command
+        """
+        action, option, inputs, _ = key
+        try:
+            with self.db_lock:
+                self.actions[action].options[option](*inputs)
+        except Messaging as handler:
+            self.speak(self.status_channel, handler.message)
+
+    def _report_timed_action(self, job, error):
+        """ Tells the status channel that a timed action failed
         """
-        for (action, option, inputs, interval), last_time in self.timed_actions.iteritems():
-            if time - last_time > interval:
-                try:
-                    action.options[option](*inputs)
-                    self.timed_actions[(action, option, inputs, interval)] = time
-                except Messaging as handler:
-                    self.speak(self.status_channel, handler.message)
-                except:
-                    self.speak(self.status_channel,
-                               'Something went terribly wrong with {0}'.format(action))
+        self.speak(self.status_channel,
+                   'Something went terribly wrong with {0}'.format(' '.join(job.key[:2])))
 
     def initiate_conv(self, channel, label, user, response, kwrds_response, time=0):
         """ Initiates conversation with users
@@ -345,20 +491,24 @@ class Brain(object):
         # store input at each steps
 
         # if no conversation yet or in some while
-        if (channel not in self.conversations or
-                abs(time - self.conversations[channel][1]) > 60):
-            self.conversations[channel] = (time, )
+        key = (channel, label)
+        conversation = self.conversations.get(key, time)
+        if conversation is None:
+            conversation = self.conversations.set(key, (), time)
             # self.speak(channel, something)
         # break ice
-        if len(self.conversations[channel]) == 1:
+        if len(conversation.inputs) == 0:
             self.speak(channel, kwrds_response[()])
-            self.conversations[channel] += (label, )
+            self.conversations.set(key, (label, ), time)
         # await response
-        elif len(self.conversations[channel]) == 2:
-            for kwrd, backtalk in ((kwrd, val)
-                                   for kwrds, val in kwrds_response.iteritems()
-                                   for kwrd in kwrds):
-                if kwrd in response:
-                    self.speak(channel, backtalk)
-                    self.conversations[channel] += (user, response)
-                    break
+        elif len(conversation.inputs) == 1:
+            # the matcher of the keywords is only built again if they changed
+            if (label not in self._conversation_matchers or
+                    self._conversation_matchers[label][0] != kwrds_response):
+                keywords = {kwrd: backtalk for kwrds, backtalk in kwrds_response.items()
+                            for kwrd in kwrds}
+                self._conversation_matchers[label] = (dict(kwrds_response), Matcher(keywords))
+            matches = self._conversation_matchers[label][1].find_all(response)
+            if matches:
+                self.speak(channel, matches[0][3])
+                self.conversations.set(key, conversation.inputs + (user, response), time)
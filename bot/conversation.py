@@ -0,0 +1,132 @@
+""" Module for remembering the conversations that the bot is having
+
+"""
+from collections import OrderedDict
+import math
+
+
+class Conversation(object):
+    """ State of a conversation
+
+    Attributes
+    ----------
+    inputs : tuple of str
+        Inputs that were given so far
+    expires : float
+        Time after which the conversation is forgotten
+    """
+    __slots__ = ('inputs', 'expires')
+
+    def __init__(self, inputs, expires):
+        self.inputs = inputs
+        self.expires = expires
+
+
+class ConversationStore(object):
+    """ Conversations that are forgotten after some time without input
+
+    The conversations are expired by a timer wheel: each conversation is put in the slot of the
+    tick in which it expires, and only the slots of the ticks that have passed are looked at, so
+    the cost of expiring does not depend on the number of conversations. When there are more than
+    `max_size` conversations, the ones that were updated the longest time ago are forgotten.
+
+    Attributes
+    ----------
+    ttl : float
+        Number of seconds without input after which a conversation is forgotten
+    max_size : int
+        Largest number of conversations that are remembered
+    tick : float
+        Number of seconds covered by each slot of the wheel
+    """
+    def __init__(self, ttl=60, max_size=1000, tick=1.0):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.tick = tick
+        # conversations from the least to the most recently updated
+        self._conversations = OrderedDict()
+        self._wheel = [set() for _ in range(int(math.ceil(ttl / tick)) + 1)]
+        self._current_tick = None
+
+    def __len__(self):
+        return len(self._conversations)
+
+    def __contains__(self, key):
+        return key in self._conversations
+
+    def _advance(self, now):
+        """ Forgets the conversations that expired by the given time
+        """
+        now_tick = int(now // self.tick)
+        if self._current_tick is None:
+            self._current_tick = now_tick
+        # a full turn of the wheel looks at every slot
+        first_tick = max(self._current_tick, now_tick - len(self._wheel) + 1)
+        for tick in range(first_tick, now_tick + 1):
+            slot = self._wheel[tick % len(self._wheel)]
+            for key in list(slot):
+                conversation = self._conversations.get(key)
+                if conversation is None or conversation.expires <= now:
+                    slot.discard(key)
+                    self._conversations.pop(key, None)
+                elif int(conversation.expires // self.tick) != tick:
+                    # the conversation was updated, so it is in another slot too
+                    slot.discard(key)
+        self._current_tick = max(self._current_tick, now_tick)
+
+    def get(self, key, now):
+        """ Returns the conversation with the given key
+
+        Parameters
+        ----------
+        key : tuple
+            Channel and user of the conversation
+        now : float
+            Current time
+
+        Returns
+        -------
+        conversation : Conversation
+            None if there is no conversation, or if it has expired
+        """
+        self._advance(now)
+        conversation = self._conversations.get(key)
+        if conversation is None or conversation.expires <= now:
+            return None
+        return conversation
+
+    def set(self, key, inputs, now):
+        """ Stores the inputs of a conversation, and keeps it for another `ttl` seconds
+
+        Parameters
+        ----------
+        key : tuple
+            Channel and user of the conversation
+        inputs : tuple of str
+            Inputs that were given so far
+        now : float
+            Current time
+
+        Returns
+        -------
+        conversation : Conversation
+            Stored conversation
+        """
+        self._advance(now)
+        expires = now + self.ttl
+        conversation = self._conversations.pop(key, None)
+        if conversation is None:
+            conversation = Conversation(tuple(inputs), expires)
+        else:
+            conversation.inputs = tuple(inputs)
+            conversation.expires = expires
+        self._conversations[key] = conversation
+        self._wheel[int(expires // self.tick) % len(self._wheel)].add(key)
+        while len(self._conversations) > self.max_size:
+            self._conversations.popitem(last=False)
+        return conversation
+
+    def pop(self, key):
+        """ Forgets the conversation with the given key
+        """
+        self._conversations.pop(key, None)
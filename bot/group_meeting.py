@@ -3,33 +3,29 @@
 Takes commands from Slack client and translate them into script
 
 """
-import re
 from datetime import datetime, timedelta
-from random import random
+import numpy as np
+from reply import Table
 from .action import Action, BadInput, Messaging
 from .utils import nice_options, where_from_identifiers
 
 class GroupMeeting(Action):
     """ Action class for group meeting management
     """
-    def __init__(self, db_conn):
+    def __init__(self, db_conn, seed=None):
         """
         Parameters
         ----------
         db_conn : sqlite3.Connection
             Database object
+            Its schema must be up to date (see `schema.migrate`).
+        seed : int
+            Seed of the random number generator that selects members
+            Default is a different selection every time
         """
         self.db_conn = db_conn
+        self.rng = np.random.default_rng(seed)
         self.cursor = self.db_conn.cursor()
-        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        if u'group_meetings' not in (j for i in self.cursor.fetchall() for j in i):
-            self.cursor.execute('''CREATE TABLE group_meetings
-            (id INTEGER PRIMARY KEY,
-             date TEXT NOT NULL,
-             presenter INTEGER,
-             chair INTEGER,
-             title TEXT)''')
-            self.db_conn.commit()
         # FIXME: there should be a better way for this
         self.col_ids = {'id':0,
                         'date':1,
@@ -73,6 +69,25 @@ class GroupMeeting(Action):
             return False
 
 
+    def available_members(self, date_obj):
+        """ Finds the members that are not away on the given date
+
+        Parameters
+        ----------
+        date_obj : datetime.date
+            Date of interest
+
+        Returns
+        -------
+        member_ids : list of int
+            Database ids of the members that are available
+        """
+        date_str = date_obj.isoformat()
+        self.cursor.execute('SELECT id FROM members WHERE NOT EXISTS'
+                            ' (SELECT 1 FROM member_absences WHERE member_id=members.id'
+                            ' AND start<=? AND end>=?) ORDER BY id', (date_str, date_str))
+        return [row[0] for row in self.cursor.fetchall()]
+
     def select_member_volunteer(self, job='', date_str=''):
         """ Asks users to volunteer
         """
@@ -88,41 +103,25 @@ class GroupMeeting(Action):
         job : str
             What role is being selected
             One of ['presenter', 'chair]
+
+        Returns
+        -------
+        member_id : int
+            Database id of the selected member
+            Members are drawn with a weight equal to the number of days since they last had the
+            job (zero if that was four weeks ago or less)
         """
         # find people that are present
-        people_present = []
-        for row in self.cursor.execute('SELECT id, name, dates_away FROM members'):
-            # translate date
-            dates = re.findall(r'\d\d\d\d-\d\d-\d\d', row[2])[:2]
-            dates = [datetime.strptime(i, '%Y-%m-%d').date() for i in dates]
-            to_dates = dates[0::2]
-            from_dates = dates[0::1]
-            for to_date, from_date in zip(to_dates, from_dates):
-                if to_date < date_obj:
-                    # ASSUME away_dates are in descending order
-                    # there is no need to loop through all dates if a date is
-                    # we find a valid date
-                    people_present.append(row[0])
-                    break
-                elif from_date <= date_obj <= to_date:
-                    # if person is away on that day, break out of loop
-                    break
-            else:
-                # if end of for loop reached
-                people_present.append(row[0])
+        people_present = np.array(self.available_members(date_obj))
 
         # find time since last presentation
-        time_since_last = []
-        for i in people_present:
-            self.cursor.execute('SELECT * FROM group_meetings WHERE {0}=?'
-                                ' ORDER BY date DESC'.format(job), (i,))
-            last_date = self.cursor.fetchone()
-            if last_date in [None, '']:
-                last_date = datetime.min.date()
-            else:
-                last_date = datetime.strptime(last_date[1], '%Y-%m-%d').date()
-            time_since_last.append((date_obj - last_date).days)
-        time_since_last = [i if i>27 else 0 for i in time_since_last]
+        self.cursor.execute('SELECT {0}, MAX(date) FROM group_meetings WHERE {0} IS NOT NULL'
+                            ' GROUP BY {0}'.format(job))
+        last_dates = dict(self.cursor.fetchall())
+        last_dates = np.array([last_dates.get(i) or datetime.min.date().isoformat()
+                               for i in people_present.tolist()], dtype='datetime64[D]')
+        time_since_last = (np.datetime64(date_obj, 'D') - last_dates).astype(int)
+        time_since_last[time_since_last <= 27] = 0
 
         # you can't present and chair at the same time
         other = ''
@@ -135,15 +134,15 @@ class GroupMeeting(Action):
                             (date_obj.isoformat(), ))
         other = self.cursor.fetchone()
         if other not in ['', None]:
-            time_since_last[people_present.index(other[0])] = 0
+            time_since_last[people_present == other[0]] = 0
 
+        if not np.any(time_since_last):
+            raise Messaging('I could not find anyone that can be the {0}.'.format(job))
         # turn timedelta into weight
-        probs = [weight*random() for weight in time_since_last]
-        # normalize
-        probs = [prob/sum(probs) for prob in probs]
+        probs = time_since_last * self.rng.random(time_since_last.size)
 
         # winner
-        return people_present[probs.index(max(probs))]
+        return people_present[np.argmax(probs)].item()
 
     def add(self, date_str='', job='', person=''):
         """ Add a presentation
@@ -238,26 +237,61 @@ class GroupMeeting(Action):
         if is_fucking_hassel:
             self.add(date_str, 'chair', 'random')
 
-    def list(self):
-        """ Shows all presentations that satifies some conditions
+    def list(self, *filters):
+        """ Shows the presentations that satifies some conditions, one page at a time
 
         Parameters
         ----------
+        filters : list of str
+            Words that describe the presentations to show, in any order
+            `upcoming` shows the presentations from today onwards, earliest first
+            `since yyyy-mm-dd` shows the presentations from the given date onwards
+            `limit N` shows N presentations per page (default is 20)
+            `page N` shows the Nth page (default is the first)
+            Without `upcoming`, the latest presentations are shown first
         """
-        #FIXME: identifier?
-        self.cursor.execute('SELECT * FROM group_meetings ORDER BY date DESC')
-        rows = self.cursor.fetchall()
-        message = '{0:<4}{1:<10}{2:<20}{3:<20}{4:<40}\n'.format('id', 'date', 'presenter', 'chair', 'title')
-        for row in rows:
-            data_id = row[0]
-            date = row[1]
-            self.cursor.execute('SELECT name FROM members WHERE id=?', (row[2],))
-            presenter = str(self.cursor.fetchone())
-            self.cursor.execute('SELECT name FROM members WHERE id=?', (row[3],))
-            chair = str(self.cursor.fetchone())
-            title = row[4]
-            message += '{0:<4}{1:<10}{2:<20}{3:<20}{4:<40}\n'.format(data_id, date, presenter, chair, title)
-        raise Messaging(message)
+        tokens = ' '.join(filters).split()
+        conditions = []
+        vals = []
+        order = 'DESC'
+        limit = 20
+        page = 1
+        usage = ('I can only list group meetings with `upcoming`, `since yyyy-mm-dd`,'
+                 ' `limit N`, and `page N`.')
+        while tokens:
+            token = tokens.pop(0)
+            if token == 'upcoming':
+                conditions.append('g.date>=?')
+                vals.append(datetime.today().date().isoformat())
+                order = 'ASC'
+            elif (token == 'since' and tokens and tokens[0] != 'next' and
+                  self.is_valid_date(tokens[0])):
+                conditions.append('g.date>=?')
+                vals.append(tokens.pop(0))
+            elif token in ['limit', 'page'] and tokens and tokens[0].isdigit() and int(tokens[0]):
+                if token == 'limit':
+                    limit = int(tokens.pop(0))
+                else:
+                    page = int(tokens.pop(0))
+            else:
+                raise Messaging(usage)
+
+        where_command = 'WHERE {0}'.format(' AND '.join(conditions)) if conditions else ''
+        # one more row than needed is fetched to know if there is another page
+        self.cursor.execute('SELECT g.id, g.date, p.name, c.name, g.title FROM group_meetings g'
+                            ' LEFT JOIN members p ON p.id=g.presenter'
+                            ' LEFT JOIN members c ON c.id=g.chair'
+                            ' {0} ORDER BY g.date {1} LIMIT ? OFFSET ?'
+                            ''.format(where_command, order),
+                            vals + [limit + 1, (page - 1) * limit])
+
+        table = Table(['{:<4}', '{:<10}', '{:<20}', '{:<20}', '{:<40}'],
+                      ['id', 'date', 'presenter', 'chair', 'title'])
+        rows = self.cursor.fetchmany(limit + 1)
+        table.add_rows(rows[:limit])
+        if len(rows) > limit:
+            table.add_line('There are more. Add `page {0}` to see them.'.format(page + 1))
+        raise Messaging('{0}\n'.format(table))
 
     def modify(self, item='', to_val='', *identifiers):
         """ Modifies existing group meeting data
@@ -48,9 +48,7 @@ class InteractiveAction(Action):
         True if channel is valid
         False if channel is not valid
         """
-        return channel in (self.actor.public_channels.keys() +
-                           self.actor.private_channels.keys() +
-                           self.actor.dm_channels.keys())
+        return channel in self.actor.channels
 
     def ask(self, channels='', ice_breaker='', kwrds_response='', action='', option='', inputs=''):
         """ Asks users for input (after telling it what to ask) and executes
@@ -0,0 +1,82 @@
+""" Module for finding many keywords in a message at once
+
+"""
+from collections import deque
+
+
+class Matcher(object):
+    """ Aho-Corasick automaton that finds all of the given keywords in a text in one pass
+
+    The automaton is built once from the keywords, after which finding the keywords takes time
+    proportional to the length of the text plus the number of matches, no matter how many keywords
+    there are.
+
+    Attributes
+    ----------
+    keywords : dict
+        Dictionary of the keyword to the value that is given back with each of its matches
+    """
+    def __init__(self, keywords):
+        """
+        Parameters
+        ----------
+        keywords : dict or list of (str, object)
+            Keywords and the values that are given back with their matches
+            Empty keywords are ignored
+        """
+        self.keywords = dict(keywords)
+        # each state is a dictionary of the next character to the next state
+        self._goto = [{}]
+        self._fail = [0]
+        # keywords that end at each state
+        self._output = [[]]
+
+        for keyword in self.keywords:
+            if keyword == '':
+                continue
+            state = 0
+            for char in keyword:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].append(keyword)
+
+        # breadth first, so that the failure of the shorter prefixes are known first
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """ Finds all of the keywords in the text
+
+        Parameters
+        ----------
+        text : str
+            Text that is searched
+
+        Returns
+        -------
+        matches : list of (int, int, str, object)
+            Start, end, keyword, and value of each match, including the overlapping ones
+            Ordered by the start, and then from the longest to the shortest
+        """
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for keyword in self._output[state]:
+                matches.append((i + 1 - len(keyword), i + 1, keyword, self.keywords[keyword]))
+        matches.sort(key=lambda match: (match[0], -match[1]))
+        return matches
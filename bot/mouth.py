@@ -14,5 +14,4 @@ def speak(self, channel, response, dm=''):
     """
     if dm != '':
         response = '<@{0}> {1}'.format(dm, response)
-    self.slack_client.api_call("chat.postMessage", channel=channel,
-                               text=response, as_user=True)
+    self.outbox.post(channel, response, as_user=True)
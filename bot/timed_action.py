@@ -1,10 +1,295 @@
 """ Module for implementing functionality periodically within some time period
 
 """
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import json
+import math
+import sqlite3
+import sys
+import threading
 import time
 from .action import Action, BadInput, Messaging
 from .utils import nice_options
 
+
+class Job(object):
+    """ Action that is run periodically
+
+    Attributes
+    ----------
+    key : tuple
+        Identifier of the job
+    func : function
+        Function that is run without arguments
+    interval : float
+        Number of seconds between the runs
+    next_time : float
+        Time at which the job is due next
+    last_time : float
+        Time at which the job last ran
+        None if it has not run yet
+    policy : {'skip', 'catch_up'}
+        What is done when the job missed some of its runs (e.g. because the previous run was slow)
+        'skip' runs it once and then continues on its schedule
+        'catch_up' runs it once for every missed run
+    is_removed : bool
+        True if the job was removed from the scheduler
+    """
+    def __init__(self, key, func, interval, next_time, last_time=None, policy='skip'):
+        if policy not in ['skip', 'catch_up']:
+            raise ValueError('Missed run policy must be one of "skip" or "catch_up".')
+        self.key = key
+        self.func = func
+        self.interval = interval
+        self.next_time = next_time
+        self.last_time = last_time
+        self.policy = policy
+        self.is_removed = False
+
+    def reschedule(self, now):
+        """ Moves the next time to the next run after the one that is due
+
+        Parameters
+        ----------
+        now : float
+            Current time
+        """
+        self.next_time += self.interval
+        if self.policy == 'skip' and self.next_time <= now:
+            # the next run is always after now, even if the job is late by a whole number of
+            # intervals
+            missed = math.floor((now - self.next_time) / self.interval) + 1
+            self.next_time += missed * self.interval
+
+
+class Scheduler(object):
+    """ Runs jobs periodically
+
+    The jobs are kept in a heap ordered by the time at which they are due next, so adding a job
+    takes O(log n) time. A removed job is only marked, and is dropped when it reaches the top of
+    the heap. The scheduler thread sleeps until the next job is due (or until a job is added), and
+    the due jobs are run by a pool of workers, so that a slow job does not delay the others. A job
+    is not run again until its previous run is finished.
+
+    Attributes
+    ----------
+    jobs : dict
+        Dictionary of the key to the job
+    on_error : function
+        Function that is called with the job and the exception when a job fails
+        Default prints the error
+    on_done : function
+        Function that is called with the job after each run, once its next time is set
+    """
+    def __init__(self, max_workers=4, on_error=None, on_done=None):
+        """
+        Parameters
+        ----------
+        max_workers : int
+            Number of jobs that can run at the same time
+        on_error : function
+            Function that is called with the job and the exception when a job fails
+        on_done : function
+            Function that is called with the job after each run
+        """
+        self.jobs = {}
+        self.on_error = on_error
+        self.on_done = on_done
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='timed_action')
+        self._thread = None
+        self._is_closed = False
+
+    def _push(self, job):
+        """ Puts the job in the heap
+        """
+        heapq.heappush(self._heap, (job.next_time, next(self._counter), job))
+        self._condition.notify_all()
+
+    def add(self, key, func, interval, next_time=None, last_time=None, policy='skip'):
+        """ Adds a job, replacing the job with the same key
+
+        Parameters
+        ----------
+        key : tuple
+            Identifier of the job
+        func : function
+            Function that is run without arguments
+        interval : float
+            Number of seconds between the runs
+        next_time : float
+            Time at which the job is due first
+            Default is one interval from now
+        last_time : float
+            Time at which the job last ran
+        policy : {'skip', 'catch_up'}
+            What is done when the job missed some of its runs
+
+        Returns
+        -------
+        job : Job
+            Added job
+        """
+        if interval <= 0:
+            raise ValueError('Interval must be positive.')
+        if next_time is None:
+            next_time = time.time() + interval
+        job = Job(key, func, interval, next_time, last_time=last_time, policy=policy)
+        with self._condition:
+            if key in self.jobs:
+                self.jobs[key].is_removed = True
+            self.jobs[key] = job
+            self._push(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+                self._thread.start()
+        return job
+
+    def remove(self, key):
+        """ Removes the job with the given key
+
+        Returns
+        -------
+        job : Job
+            Removed job
+        None if there is no job with the given key
+        """
+        with self._condition:
+            job = self.jobs.pop(key, None)
+            if job is not None:
+                job.is_removed = True
+                self._condition.notify_all()
+            return job
+
+    def close(self):
+        """ Stops running the jobs
+        """
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    def _run(self):
+        """ Hands the due jobs to the workers
+        """
+        with self._condition:
+            while not self._is_closed:
+                # drop the jobs that were removed
+                while self._heap and self._heap[0][2].is_removed:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                wait_time = self._heap[0][0] - time.time()
+                if wait_time > 0:
+                    self._condition.wait(wait_time)
+                    continue
+                job = heapq.heappop(self._heap)[2]
+                self._pool.submit(self._work, job)
+
+    def _work(self, job):
+        """ Runs the job and puts it back in the heap
+        """
+        try:
+            job.func()
+        except Exception as error:
+            if self.on_error is not None:
+                self.on_error(job, error)
+            else:
+                print('Timed action {0} failed: {1}'.format(job.key, error), file=sys.stderr)
+        now = time.time()
+        with self._condition:
+            job.last_time = now
+            job.reschedule(now)
+            if job.is_removed or self._is_closed:
+                return
+            self._push(job)
+            # within the lock, so that a job that is being removed is not stored again
+            if self.on_done is not None:
+                self.on_done(job)
+
+class TimedActionStore(object):
+    """ Table of the timed actions in the database, so that they survive restarts of the bot
+
+    The table is created by `schema.migrate`. The store uses its own connection, because it is
+    written from the workers of the scheduler.
+
+    Attributes
+    ----------
+    db_conn : sqlite3.Connection
+        Connection to the database
+    """
+    def __init__(self, db_path):
+        """
+        Parameters
+        ----------
+        db_path : str
+            Path to the database
+        """
+        self.db_conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def load(self):
+        """ Returns all of the stored timed actions
+
+        Returns
+        -------
+        timed_actions : list of tuple
+            Key (name of action, option, inputs, interval), last time, and next time of each
+            timed action
+        """
+        with self._lock:
+            rows = self.db_conn.execute('SELECT action, option, inputs, interval, last_time,'
+                                        ' next_time FROM timed_actions').fetchall()
+        return [((action, option, tuple(json.loads(inputs)), interval), last_time, next_time)
+                for action, option, inputs, interval, last_time, next_time in rows]
+
+    def save(self, key, last_time, next_time):
+        """ Stores a timed action, replacing the one with the same key
+
+        Parameters
+        ----------
+        key : tuple
+            Name of action, option, inputs, and interval of the timed action
+        last_time : float
+            Time at which it last ran
+        next_time : float
+            Time at which it runs next
+        """
+        action, option, inputs, interval = key
+        with self._lock, self.db_conn:
+            self.db_conn.execute('INSERT OR REPLACE INTO timed_actions (action, option, inputs,'
+                                 ' interval, last_time, next_time) VALUES (?,?,?,?,?,?)',
+                                 (action, option, json.dumps(list(inputs)), interval, last_time,
+                                  next_time))
+
+    def delete(self, key):
+        """ Removes a timed action
+
+        Parameters
+        ----------
+        key : tuple
+            Name of action, option, inputs, and interval of the timed action
+        """
+        action, option, inputs, interval = key
+        with self._lock, self.db_conn:
+            self.db_conn.execute('DELETE FROM timed_actions WHERE action=? AND option=? AND'
+                                 ' inputs=? AND interval=?',
+                                 (action, option, json.dumps(list(inputs)), interval))
+
+    def close(self):
+        """ Closes the connection to the database
+        """
+        with self._lock:
+            self.db_conn.close()
+
+
 class TimedAction(Action):
     """ Action class for repeating actions
     """
@@ -38,10 +323,14 @@ class TimedAction(Action):
 
         """
         msg = 'Here are the registered timed actions:\n'
-        for (action, option, inputs, interval), last_time in self.actor.timed_actions.iteritems():
+        jobs = sorted(self.actor.scheduler.jobs.values(), key=lambda job: job.next_time)
+        for job in jobs:
+            action, option, inputs, interval = job.key
+            last_time = 'Never' if job.last_time is None else time.ctime(job.last_time)
             msg += ('Command: {0} {1} {2}\n'
                     'Time Interval: {3}\n'
-                    'Last Time: {4}\n\n'.format(action.name, option, inputs, interval, last_time))
+                    'Last Time: {4}\n\n'.format(action, option, ' '.join(inputs), interval,
+                                                 last_time))
         # I'm being lazy here. Because I need the channel to speak, but I think
         # channel should be independent of the action
         raise Messaging(msg)
@@ -49,6 +338,8 @@ class TimedAction(Action):
     def add(self, interval='', action='', option='', *commands):
         """ Adds a new periodic function
 
+        The action is run once right away, to check its inputs
+
         Parameters
         ----------
         interval : str
@@ -63,8 +354,10 @@ class TimedAction(Action):
         """
         try:
             interval = int(interval)
+            if interval <= 0:
+                raise ValueError
         except (ValueError, IndexError):
-            raise BadInput('How often should the action be repeated?')
+            raise BadInput('How often (in seconds) should the action be repeated?')
 
         allowed_actions = [i for i in self.actor.actions if i != self.name]
         if action not in allowed_actions:
@@ -76,16 +369,16 @@ class TimedAction(Action):
         action = self.actor.actions[action]
         if option not in action.options:
             raise BadInput(action.init_response, args=(str(interval), action.name))
-        # ugh
         inputs = tuple(commands)
+        key = (action.name, option, inputs, interval)
         try:
             action.options[option](*inputs)
-            self.actor.timed_actions[(action.name, option, inputs, interval)] = time.time()
         except BadInput as handler:
             raise BadInput(handler.message, args=(str(interval), action.name, option) + handler.args)
         except Messaging as handler:
-            self.actor.timed_actions[(action, option, inputs, interval)] = time.time()
+            self.actor.add_timed_action(key, last_time=time.time())
             raise handler
+        self.actor.add_timed_action(key, last_time=time.time())
 
     def remove(self, action='', *commands):
         """ Removes a periodic function from list
@@ -107,4 +400,13 @@ class TimedAction(Action):
         if error_msg != '':
             raise BadInput(error_msg)
 
+        option, inputs = commands[0], tuple(commands[1:])
+        keys = [key for key in list(self.actor.scheduler.jobs)
+                if key[:3] == (action, option, inputs)]
+        if len(keys) == 0:
+            raise Messaging('I could not find the timed action, {0}.'
+                            ''.format(' '.join((action,) + commands)))
+        for key in keys:
+            self.actor.remove_timed_action(key)
+
     #TODO: modify
@@ -0,0 +1,183 @@
+"""Shared directory of the Slack channels that the bot can see."""
+import sys
+import threading
+
+
+class ChannelDirectory:
+    """Names and ids of the Slack channels, refreshed in the background.
+
+    The directory is fetched from Slack when it is created and again every `ttl` seconds. A fetch
+    that fails is tried again after `retry_delay` seconds, and then after twice as long each time,
+    up to `ttl`. RTM events about channels that are created, renamed, or deleted update it right
+    away (see `handle_event`).
+
+    With `background`, the first fetch is also made in the background, so that it overlaps with the
+    rest of the start up (e.g. the RTM connection). Lookups wait for the first successful fetch, for
+    at most `load_timeout` seconds, and fail if there is none by then.
+
+    Attributes
+    ----------
+    slack_client : SlackClient
+        Slack client used to fetch the channels.
+    ttl : float
+        Number of seconds between refreshes.
+    retry_delay : float
+        Number of seconds before a failed fetch is first tried again.
+    public_channels : dict of str to str
+        Dictionary of public channels name to id.
+    private_channels : dict of str to str
+        Dictionary of private channels name to id.
+    dm_channels : dict of str to str
+        Dictionary of direct message channels user id to channel id.
+    names : dict of str to str
+        Dictionary of channel id to name (or user id, for direct message channels).
+    load_timeout : float
+        Largest number of seconds that a lookup waits for the first successful fetch.
+
+    """
+    def __init__(self, slack_client, ttl=300.0, start=True, background=False, load_timeout=30.0,
+                 retry_delay=1.0):
+        self.slack_client = slack_client
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.load_timeout = load_timeout
+        self.public_channels = {}
+        self.private_channels = {}
+        self.dm_channels = {}
+        self.names = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._loaded = threading.Event()
+        self._thread = None
+        if not start:
+            self._loaded.set()
+        else:
+            # None makes the thread fetch the channels first
+            is_refreshed = None if background else self.refresh()
+            self._thread = threading.Thread(target=self._run, args=(is_refreshed, ),
+                                            name='channel_directory', daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        """Fetch all of the channels from Slack.
+
+        Returns
+        -------
+        is_refreshed : bool
+            False if Slack could not be reached. The directory is then left unchanged, and is not
+            taken to be loaded if it was never fetched.
+
+        """
+        try:
+            public = {i['name']: i['id']
+                      for i in self.slack_client.api_call('channels.list')['channels']}
+            private = {i['name']: i['id']
+                       for i in self.slack_client.api_call('groups.list')['groups']}
+            dm = {i['user']: i['id'] for i in self.slack_client.api_call('im.list')['ims']}
+        except Exception as error:
+            print('Could not refresh the channels: {0}'.format(error), file=sys.stderr)
+            return False
+        with self._lock:
+            self.public_channels = public
+            self.private_channels = private
+            self.dm_channels = dm
+            self._update_names()
+        self._loaded.set()
+        return True
+
+    def close(self):
+        """Stop refreshing the directory."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, is_refreshed):
+        """Refresh the directory every `ttl` seconds, and sooner after a failed refresh."""
+        if is_refreshed is None:
+            is_refreshed = self.refresh()
+        delay = self.retry_delay
+        while True:
+            if is_refreshed:
+                wait, delay = self.ttl, self.retry_delay
+            else:
+                wait, delay = delay, min(delay * 2, self.ttl)
+            if self._stop.wait(wait):
+                return
+            is_refreshed = self.refresh()
+
+    def _wait_loaded(self):
+        """Wait for the first successful fetch of the directory.
+
+        Raises
+        ------
+        RuntimeError
+            If the channels could not be fetched within `load_timeout` seconds.
+
+        """
+        if not self._loaded.wait(self.load_timeout):
+            raise RuntimeError('The channels could not be fetched from Slack.')
+
+    def _update_names(self):
+        """Rebuild the dictionary of channel id to name."""
+        names = {}
+        for channels in [self.dm_channels, self.private_channels, self.public_channels]:
+            names.update((j, i) for i, j in channels.items())
+        self.names = names
+
+    def _set(self, attr, key, channel_id):
+        """Add a channel to one of the dictionaries, dropping the entry it replaces."""
+        with self._lock:
+            channels = {i: j for i, j in getattr(self, attr).items() if j != channel_id}
+            channels[key] = channel_id
+            setattr(self, attr, channels)
+            self._update_names()
+
+    def _remove(self, channel_id):
+        """Remove a channel from the directory."""
+        with self._lock:
+            for attr in ['public_channels', 'private_channels', 'dm_channels']:
+                setattr(self, attr,
+                        {i: j for i, j in getattr(self, attr).items() if j != channel_id})
+            self._update_names()
+
+    def handle_event(self, event):
+        """Update the directory from an RTM event.
+
+        Parameters
+        ----------
+        event : dict
+            Event returned by `SlackClient.rtm_read`.
+            Events that are not about channels are ignored.
+
+        """
+        event_type = event.get('type')
+        if event_type in ['channel_created', 'channel_rename']:
+            self._set('public_channels', event['channel']['name'], event['channel']['id'])
+        elif event_type in ['group_joined', 'group_rename']:
+            self._set('private_channels', event['channel']['name'], event['channel']['id'])
+        elif event_type == 'im_created':
+            self._set('dm_channels', event['user'], event['channel']['id'])
+        elif event_type in ['channel_deleted', 'group_left', 'group_deleted']:
+            channel = event['channel']
+            self._remove(channel['id'] if isinstance(channel, dict) else channel)
+
+    def id(self, name):
+        """Return the id of the public or private channel with the given name, or None."""
+        self._wait_loaded()
+        channel_id = self.public_channels.get(name)
+        return channel_id if channel_id is not None else self.private_channels.get(name)
+
+    def name(self, channel_id):
+        """Return the name of the channel with the given id, or None."""
+        self._wait_loaded()
+        return self.names.get(channel_id)
+
+    def __contains__(self, name):
+        """Check if there is a public, private, or direct message channel with the given name.
+
+        Direct message channels go by the user id of the other person.
+
+        """
+        self._wait_loaded()
+        return (name in self.public_channels or name in self.private_channels or
+                name in self.dm_channels)
@@ -1,27 +1,148 @@
-import RPi.GPIO as GPIO
-from threading import Timer
+import threading
+import time
 import datetime
 from action import ActionInputError
+from member_directory import directory
 import members
 
 
-def setup():
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setup(4, GPIO.OUT)
+class FakeGPIO:
+    """Stand-in for RPi.GPIO that records the output of the pins instead of driving them.
 
+    Attributes
+    ----------
+    mode : str
+        Numbering of the pins.
+    pins : dict of int to int
+        Current output of each pin that has been set up.
+    history : list of tuple
+        Time (from `time.monotonic`), pin, and output of every change to the output of a pin.
+
+    """
+    BCM = 'BCM'
+    OUT = 'OUT'
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {}
+        self.history = []
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction):
+        if self.mode is None:
+            raise RuntimeError('Please set pin numbering mode using GPIO.setmode')
+        self.pins[pin] = self.LOW
+
+    def output(self, pin, value):
+        if pin not in self.pins:
+            raise RuntimeError('The GPIO channel has not been set up as an OUTPUT')
+        self.pins[pin] = value
+        self.history.append((time.monotonic(), pin, value))
+
+    def cleanup(self):
+        self.pins = {}
 
-def set_on():
-    GPIO.output(4, GPIO.HIGH)
 
+class DoorController:
+    """Owner of the pin that drives the door relay.
 
-def set_off():
-    GPIO.output(4, GPIO.LOW)
+    The pin is set up once, and a single worker thread turns the relay off at the end of each pulse.
+    Opening the door while it is already open extends the current pulse instead of starting another.
+
+    Attributes
+    ----------
+    gpio : module
+        Backend that drives the pins, e.g. RPi.GPIO or an instance of FakeGPIO.
+    pin : int
+        BCM number of the pin that is connected to the relay.
+    duration : float
+        Number of seconds that the relay is kept on after the last request to open the door.
+    pulses : int
+        Number of times the relay has been turned on.
+
+    """
+    def __init__(self, gpio, pin=4, duration=3.0):
+        self.gpio = gpio
+        self.pin = pin
+        self.duration = duration
+        self.pulses = 0
+        self._off_time = None
+        self._is_closed = False
+        self._condition = threading.Condition()
+
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.pin, self.gpio.OUT)
+        self.gpio.output(self.pin, self.gpio.LOW)
+        self._thread = threading.Thread(target=self._run, name='door', daemon=True)
+        self._thread.start()
+
+    @property
+    def is_open(self):
+        """True if the relay is currently on."""
+        with self._condition:
+            return self._off_time is not None
+
+    def open(self):
+        """Turn the relay on, or keep it on for longer if it is already on."""
+        with self._condition:
+            if self._is_closed:
+                raise RuntimeError('The door controller has been closed.')
+            if self._off_time is None:
+                self.gpio.output(self.pin, self.gpio.HIGH)
+                self.pulses += 1
+            self._off_time = time.monotonic() + self.duration
+            self._condition.notify()
+
+    def close(self):
+        """Turn the relay off and stop the worker thread."""
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        """Turn the relay off at the end of each pulse."""
+        with self._condition:
+            while not self._is_closed:
+                if self._off_time is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._off_time - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                self.gpio.output(self.pin, self.gpio.LOW)
+                self._off_time = None
+            if self._off_time is not None:
+                self.gpio.output(self.pin, self.gpio.LOW)
+                self._off_time = None
+
+
+controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    """Return the controller of the door relay, creating it on first use.
+
+    RPi.GPIO is only imported here, so that the bot starts without waiting for the hardware.
+
+    """
+    global controller
+    with _controller_lock:
+        if controller is None:
+            import RPi.GPIO as GPIO
+            controller = DoorController(GPIO)
+        return controller
 
 
 def set_open():
-    setup()
-    set_on()
-    Timer(3.0, set_off).start()
+    """Open the door for a few seconds."""
+    get_controller().open()
 
 
 def has_permission(cursor, user):
@@ -36,15 +157,13 @@ def has_permission(cursor, user):
         Can be name, userid, slack id or id.
 
     """
-    cursor.execute('SELECT door_permission FROM members WHERE name=? OR userid=? OR slack_id=? OR '
-                   'id=?', (user,)*4)
-    rows = cursor.fetchall()
+    index = directory.door_index(cursor)
 
-    if len(rows) > 1:
+    if str(user) in index.ambiguous:
         raise ActionInputError('I found more than one person that goes by the identification, {0}'
                                ''.format(user))
     else:
-        return len(rows) == 1 and rows[0][0] == 'yesdoor'
+        return str(user) in index.allowed
 
 
 def add(db_conn, user, user_to_add):
@@ -60,10 +179,7 @@ def add(db_conn, user, user_to_add):
         User to add to the database.
 
     """
-    cursor = db_conn.cursor()
-    cursor.execute('SELECT id FROM members WHERE name=? OR userid=? OR slack_id=? OR '
-                   'id=?', (user_to_add,)*4)
-    rows = cursor.fetchall()
+    rows = directory.find(db_conn.cursor(), user_to_add)
     if len(rows) > 1:
         raise ActionInputError('I found more than one person that goes by {0}'.format(user_to_add))
     elif len(rows) == 0:
@@ -72,7 +188,7 @@ def add(db_conn, user, user_to_add):
         members.modify(db_conn, user, 'door_permission', 'yesdoor', 'id', rows[0][0])
 
 
-def open_door(db_conn, user):
+def open_door(db_conn, user, logger=None):
     """Open the door.
 
     Parameters
@@ -81,14 +197,20 @@ def open_door(db_conn, user):
         Database connection object.
     user : str
         Person who wants to open the door.
+    logger : event_log.EventLogger
+        Logger that writes the opening to the door log in the background.
+        Default writes the opening to the door log before returning.
 
     """
     cursor = db_conn.cursor()
     if has_permission(cursor, user):
         set_open()
-        cursor.execute("INSERT INTO doorlog (time, userid) VALUES (?,?)",
-                       (str(datetime.datetime.now()), user),)
-        db_conn.commit()
+        if logger is not None:
+            logger.log('doorlog', user)
+        else:
+            cursor.execute("INSERT INTO doorlog (time, userid) VALUES (?,?)",
+                           (str(datetime.datetime.now()), user),)
+            db_conn.commit()
         raise ActionInputError('Bleep bloop')
     else:
         raise ActionInputError("I'm sorry, {0}, but I'm afraid I can't do that.".format(user))
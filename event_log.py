@@ -0,0 +1,117 @@
+"""Module for writing the door and quiet logs without waiting for the disk."""
+import datetime
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+
+class EventLogger:
+    """Append-only logger that writes the events to the database from a background thread.
+
+    Events are collected and written in a single transaction once `batch_size` events are waiting
+    or `interval` seconds after the first waiting event, whichever comes first.
+
+    Attributes
+    ----------
+    db_path : str
+        Path to the database. The logger uses its own connection so that its transactions do not mix
+        with those of the bot.
+    interval : float
+        Maximum number of seconds that an event waits before it is written.
+    batch_size : int
+        Maximum number of events that are written in one transaction.
+
+    """
+    def __init__(self, db_path, interval=0.5, batch_size=50):
+        self.db_path = db_path
+        self.interval = interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='event_log', daemon=True)
+        self._thread.start()
+
+    def log(self, table, userid):
+        """Log an event that happened now.
+
+        Parameters
+        ----------
+        table : {'doorlog', 'quietlog'}
+            Table in which the event is stored.
+        userid : str
+            User that caused the event.
+
+        """
+        self._queue.put((table, (str(datetime.datetime.now()), userid)))
+
+    def flush(self):
+        """Wait until all of the events that were logged so far are written."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        """Write the remaining events and stop the background thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _write(self, db_conn, events):
+        """Write the given events in one transaction.
+
+        Returns
+        -------
+        written : bool
+            False if the events could not be written. They should be tried again later.
+
+        """
+        tables = {}
+        for table, row in events:
+            tables.setdefault(table, []).append(row)
+        try:
+            for table, rows in tables.items():
+                db_conn.executemany('INSERT INTO {0} (time, userid) VALUES (?,?)'.format(table),
+                                    rows)
+            db_conn.commit()
+        except sqlite3.Error as error:
+            db_conn.rollback()
+            print('Could not write {0} events to the log: {1}'.format(len(events), error),
+                  file=sys.stderr)
+            return False
+        return True
+
+    def _run(self):
+        """Collect the events and write them in batches."""
+        db_conn = sqlite3.connect(self.db_path)
+        events = []
+        waiting = []
+        deadline = None
+        is_closing = False
+        while not is_closing:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                if item is None:
+                    is_closing = True
+                elif isinstance(item, threading.Event):
+                    waiting.append(item)
+                else:
+                    events.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.interval
+
+            if (is_closing or waiting or len(events) >= self.batch_size or
+                    (deadline is not None and time.monotonic() >= deadline)):
+                if not events or self._write(db_conn, events):
+                    events = []
+                    deadline = None
+                else:
+                    deadline = time.monotonic() + self.interval
+                for done in waiting:
+                    done.set()
+                waiting = []
+        db_conn.close()
@@ -0,0 +1,292 @@
+"""Module for running the commands of the bot on a pool of workers."""
+import collections
+import heapq
+import itertools
+import sys
+import threading
+import time
+import traceback
+from action import ActionInputError
+
+
+# priority lane of the commands
+# max_queued is the largest number of commands that can wait in the lane, and max_running is the
+# largest number of workers that can run its commands at once (None is no limit)
+Lane = collections.namedtuple('Lane', ['name', 'max_queued', 'max_running'])
+
+
+class Command:
+    """Command that was handed to the executor.
+
+    Attributes
+    ----------
+    key : hashable
+        Commands with the same key are run one at a time, in the order they were submitted.
+    lane : str
+        Name of the lane of the command.
+    func : function
+        Function that runs the command without arguments.
+    timeout : float
+        Number of seconds after which the command is given up on, or None.
+    on_timeout : function
+        Function that is called without arguments when the command times out.
+    is_released : bool
+        True once the command has finished or timed out, after which the next command with the same
+        key can run.
+    submitted : float
+        Time at which the command was submitted.
+
+    """
+    def __init__(self, key, lane, func, timeout=None, on_timeout=None):
+        self.key = key
+        self.lane = lane
+        self.func = func
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.is_released = False
+        self.submitted = time.monotonic()
+
+
+class CommandExecutor:
+    """Pool of workers that runs the commands so that a slow command does not hold up the others.
+
+    Commands with the same key (e.g. the channel and the user) are run one at a time, in the order
+    they were submitted, so their replies come in order. A command that runs longer than its
+    timeout is given up on: `on_timeout` is called and the next command with the same key is
+    started. A thread cannot be stopped, so the command keeps running in the background and still
+    replies once it is done. The deadlines of the running commands are kept in a heap that one
+    watchdog thread looks after, so a command does not start a thread of its own.
+
+    The commands are sorted into lanes. A free worker takes the oldest command of the first lane
+    (in the order of `lanes`) that has a command ready and fewer than `max_running` running
+    commands, so urgent commands overtake the others. The limits of the other lanes must leave at
+    least one worker for the first lane, so slow commands (including the ones that timed out,
+    which keep their worker) cannot hold up the most urgent ones. When a lane already holds
+    `max_queued` commands, new commands are turned away with a message to try again, instead of
+    piling up. Ordering by key only applies within a lane.
+
+    Attributes
+    ----------
+    max_workers : int
+        Number of commands that can run at the same time.
+    timeout : float
+        Number of seconds after which a command is given up on, unless it is given its own timeout.
+        None means that commands are never given up on.
+    lanes : list of Lane
+        Lanes of the commands, from the most to the least urgent.
+
+    Raises
+    ------
+    ValueError
+        If the lanes after the first one can take all of the workers.
+
+    """
+    def __init__(self, max_workers=4, timeout=None, lanes=(Lane('default', None, None), )):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.lanes = list(lanes)
+        other_lanes = self.lanes[1:]
+        if other_lanes and (any(lane.max_running is None for lane in other_lanes) or
+                            sum(lane.max_running for lane in other_lanes) > max_workers - 1):
+            raise ValueError('The lanes after the first one must leave at least one worker for the'
+                             ' first lane.')
+        # commands that can run, in the order they were submitted, by lane
+        self._ready = {lane.name: collections.deque() for lane in self.lanes}
+        # commands that wait for the command with the same key, by lane and key
+        self._waiting = {}
+        # number of commands that have not started, number of running commands, number of
+        # started commands, total and longest wait (in seconds), by lane
+        self._stats = {lane.name: {'queued': 0, 'running': 0, 'started': 0, 'total_wait': 0.0,
+                                   'max_wait': 0.0}
+                       for lane in self.lanes}
+        # deadline, order of submission, and command of the running commands that have a timeout
+        self._deadlines = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._is_closed = False
+        self._is_stopped = False
+        self._threads = []
+        self._watchdog = None
+
+    def _start(self):
+        """Start the workers and the watchdog if they are not running yet."""
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, daemon=True,
+                                              name='command_watchdog')
+            self._watchdog.start()
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._work, daemon=True,
+                                      name='command_{0}'.format(len(self._threads)))
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, func, lane=None, timeout=None, on_timeout=None):
+        """Queue a command.
+
+        Parameters
+        ----------
+        key : hashable
+            Commands with the same key (and lane) are run one at a time, in order.
+        func : function
+            Function that runs the command without arguments. It should reply to the user itself;
+            unexpected errors are only printed.
+        lane : str
+            Name of the lane of the command.
+            Default is the least urgent lane.
+        timeout : float
+            Number of seconds after which the command is given up on.
+            Default is `timeout`.
+        on_timeout : function
+            Function that is called without arguments when the command times out.
+
+        Returns
+        -------
+        command : Command
+            Queued command.
+
+        Raises
+        ------
+        ActionInputError
+            If the lane is full.
+
+        """
+        if lane is None:
+            lane = self.lanes[-1].name
+        command = Command((lane, key), lane, func, self.timeout if timeout is None else timeout,
+                          on_timeout)
+        max_queued = next(i.max_queued for i in self.lanes if i.name == lane)
+        with self._condition:
+            if self._is_closed:
+                raise RuntimeError('Cannot submit a command after the executor is closed.')
+            stats = self._stats[lane]
+            if max_queued is not None and stats['queued'] >= max_queued:
+                raise ActionInputError("I'm busy right now. Try again in a moment.")
+            self._start()
+            stats['queued'] += 1
+            if command.key in self._waiting:
+                self._waiting[command.key].append(command)
+            else:
+                self._waiting[command.key] = collections.deque()
+                self._ready[lane].append(command)
+                self._condition.notify_all()
+        return command
+
+    def stats(self):
+        """Return the number of waiting commands and the time they waited, for each lane.
+
+        Returns
+        -------
+        stats : collections.OrderedDict
+            Dictionary of the name of the lane to a dictionary with the number of commands that
+            wait ('queued') and run ('running'), the number of started commands ('started'), and
+            the mean and longest number of seconds that they waited before they started
+            ('mean_wait' and 'max_wait').
+
+        """
+        with self._condition:
+            stats = collections.OrderedDict()
+            for lane in self.lanes:
+                lane_stats = dict(self._stats[lane.name])
+                total_wait = lane_stats.pop('total_wait')
+                lane_stats['mean_wait'] = total_wait / max(lane_stats['started'], 1)
+                stats[lane.name] = lane_stats
+            return stats
+
+    def close(self):
+        """Run the queued commands and stop the workers."""
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        with self._condition:
+            self._is_stopped = True
+            self._condition.notify_all()
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    def _release(self, command):
+        """Let the next command with the same key run.
+
+        Returns
+        -------
+        is_released : bool
+            False if the command had already been released.
+
+        """
+        with self._condition:
+            if command.is_released:
+                return False
+            command.is_released = True
+            waiting = self._waiting[command.key]
+            if waiting:
+                self._ready[command.lane].append(waiting.popleft())
+                self._condition.notify_all()
+            else:
+                del self._waiting[command.key]
+            return True
+
+    def _expire(self, command):
+        """Give up on a command that took too long."""
+        if self._release(command) and command.on_timeout is not None:
+            command.on_timeout()
+
+    def _watch(self):
+        """Give up on the commands that run past their deadline."""
+        while True:
+            with self._condition:
+                # the commands that finished in time are dropped
+                while self._deadlines and self._deadlines[0][2].is_released:
+                    heapq.heappop(self._deadlines)
+                if self._is_stopped:
+                    return
+                if not self._deadlines:
+                    self._condition.wait()
+                    continue
+                wait = self._deadlines[0][0] - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                command = heapq.heappop(self._deadlines)[2]
+            self._expire(command)
+
+    def _next(self):
+        """Return the first lane that has a command that can run, or None."""
+        for lane in self.lanes:
+            if (self._ready[lane.name] and (lane.max_running is None or
+                                            self._stats[lane.name]['running'] < lane.max_running)):
+                return lane.name
+        return None
+
+    def _work(self):
+        """Run the commands as they become ready."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._next() is not None or
+                                         (self._is_closed and not any(self._ready.values())))
+                lane = self._next()
+                if lane is None:
+                    return
+                command = self._ready[lane].popleft()
+                stats = self._stats[lane]
+                wait = time.monotonic() - command.submitted
+                stats['queued'] -= 1
+                stats['running'] += 1
+                stats['started'] += 1
+                stats['total_wait'] += wait
+                stats['max_wait'] = max(stats['max_wait'], wait)
+                if command.timeout is not None:
+                    heapq.heappush(self._deadlines, (time.monotonic() + command.timeout,
+                                                     next(self._counter), command))
+                    self._condition.notify_all()
+
+            try:
+                command.func()
+            except Exception:
+                print('Unexpected error in command {0}:'.format(command.key), file=sys.stderr)
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._stats[command.lane]['running'] -= 1
+                    self._condition.notify_all()
+                self._release(command)
@@ -1,17 +1,121 @@
 import os
-import shutil
-from subprocess import call
-import urllib.request
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from action import ActionInputError
+from spooler import Spooler
+from upload_cache import UploadCache
+import utils
 
+# directory in which the uploaded files are stored
+upload_dir = '/tmp/ayerslab_uploads'
+# largest file (in bytes) that can be uploaded
+max_upload_size = 50 * 1024 * 1024
+# uploaded files, stored under the hash of their contents
+upload_cache = UploadCache(upload_dir, max_size=500 * 1024 * 1024)
+# extensions of the files that can be uploaded
+allowed_extensions = ('.pdf', '.ps', '.txt', '.png', '.jpg', '.jpeg')
+# number of bytes that are read from the network at once
+chunk_size = 64 * 1024
+# workers that download the uploaded files
+download_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload')
+# printer and the command that sends jobs to it
+printer = 'HP_LaserJet_400_color_M451dw'
+lp_command = 'lp'
+# queue of the print jobs
+spooler = Spooler()
 
-def upload(msg):
+
+def download(url, path, max_size=None):
+    """Download a file in chunks and move it into place once it is complete.
+
+    The file is first written to a temporary file in the same directory, so a file that is only
+    partly downloaded never shows up under the given path.
+
+    Parameters
+    ----------
+    url : str
+        Location of the file.
+    path : str
+        Path where the file is stored.
+    max_size : int
+        Largest number of bytes that are downloaded.
+        Default is `max_upload_size`.
+
+    Returns
+    -------
+    size : int
+        Number of bytes that were downloaded.
+
+    Raises
+    ------
+    ActionInputError
+        If the file is larger than the maximum size.
+
+    """
+    # urllib is only needed once a file is uploaded, so it is not imported when the bot starts
+    import urllib.request
+
+    if max_size is None:
+        max_size = max_upload_size
+    too_large = ActionInputError('The file is larger than the {0} MB that I can take.'
+                                 ''.format(max_size // 1024**2))
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as fh, urllib.request.urlopen(url) as response:
+            if int(response.headers.get('Content-Length', 0)) > max_size:
+                raise too_large
+            size = 0
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise too_large
+                fh.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return size
+
+
+def _download_and_report(url, filename, speak):
+    """Download the file into the upload cache and tell the user how it went."""
+    path = upload_cache.temp_path()
+    try:
+        download(url, path)
+        upload_cache.add(filename, path)
+    except ActionInputError as error:
+        message = 'I could not download {0}. {1}'.format(filename, error)
+    except Exception as error:
+        message = 'I could not download {0}: {1}'.format(filename, error)
+    else:
+        message = '{0} is ready to be printed.'.format(filename)
+    if os.path.exists(path):
+        os.remove(path)
+    if speak is not None:
+        speak(message)
+    else:
+        print(message, file=sys.stderr)
+
+
+def upload(msg, speak=None):
     """Download the file provided in the Slack message data.
 
+    The file is downloaded in the background by `download_pool` and stored in the `upload_cache`.
+    Slack gives every upload a new id and url, so an upload cannot be told to be a duplicate before
+    it is downloaded. A file whose contents are already stored is kept only once (see
+    `UploadCache.add`).
+
     Parameters
     ----------
     msg : dict
         Dictionary that contains the key 'download' and the url as the key.
+    speak : function
+        Function that replies to the user with the given message once the download is done.
 
     """
     try:
@@ -21,21 +125,26 @@ def upload(msg):
                                ' the comment to the uploaded file.')
 
     filename = url.split('/')[-1]
-    # TODO: probably should put in some sort of limitation to the files that can be uploaded
-    # if os.path.splitext(filename)[-1] != '.pdf':
-    #     raise ActionInputError('You can only upload pdf files.')
-    with urllib.request.urlopen(url) as response, open(os.path.join('/tmp', filename), 'wb') as fh:
-        shutil.copyfileobj(response, fh)
-    raise ActionInputError('Bleep bloop.')
+    if os.path.splitext(filename)[-1].lower() not in allowed_extensions:
+        raise ActionInputError('You can only upload files that end with {0}.'
+                               ''.format(utils.nice_options(allowed_extensions)))
+    download_pool.submit(_download_and_report, url, filename, speak)
+    raise ActionInputError('Bleep bloop. I will let you know when {0} is ready.'.format(filename))
+
 
+def file_print(speak, user, filename, sided='double', color='black', quality='economy', pages=''):
+    """Print provided file in the upload cache.
 
-def file_print(filename, sided='double', color='black', quality='economy', pages=''):
-    """Print provided file in the tmp directory.
+    The job is queued in the `spooler`, and the user is told once it has been printed.
 
     Parameters
     ----------
+    speak : function
+        Function that replies to the user.
+    user : str
+        User that wants to print the file.
     filename : str
-        Name of the file stored in the tmp directory.
+        Name under which the file was uploaded.
     sided : {'single', 'double'}
         Number of sides on the paper to print.
         Default is double sided printing.
@@ -50,9 +159,12 @@ def file_print(filename, sided='double', color='black', quality='economy', pages
         Default is all pages.
 
     """
-    filename = os.path.join('/tmp', filename)
+    path = upload_cache.path(filename)
+    if path is None:
+        raise ActionInputError('I could not find {0}. You must upload it first.'.format(filename))
 
-    command = ['lpr', '-P', 'HP_LaserJet_400_color_M451dw']
+    # lp is used rather than lpr because it reports the id of the job
+    command = [lp_command, '-d', printer]
     if sided == 'single':
         command += ['-o', 'sides=one-sided']
     elif sided == 'double':
@@ -82,7 +194,27 @@ def file_print(filename, sided='double', color='black', quality='economy', pages
     # page size
     command += ['-o', 'media=Letter']
     # print file
-    command.append(filename)
+    command.append(path)
+
+    job = spooler.submit(user, filename, command, speak)
+    raise ActionInputError('Bleep bloop. Your print job is number {0}.'.format(job.number))
+
 
-    call(command)
+def print_status():
+    """Show the print jobs that are queued or printing."""
+    raise ActionInputError(spooler.status())
+
+
+def print_cancel(user, number):
+    """Cancel a print job.
+
+    Parameters
+    ----------
+    user : str
+        User that wants to cancel the job.
+    number : str
+        Number of the job that is shown by `print status`.
+
+    """
+    spooler.cancel(user, number)
     raise ActionInputError('Bleep bloop.')
@@ -1,7 +1,14 @@
+# time is imported, and the clock read, before the other modules so that the time spent
+# importing them (e.g. slackclient) is part of the reported start up time
+import time
+# time at which the bot started, from which the start up is timed
+start_time = time.monotonic()
+
 import os
 import shlex
 import sqlite3
-import time
+import sys
+import threading
 from slackclient import SlackClient
 import action
 import utils
@@ -9,180 +16,265 @@ import door
 import members
 import quiet
 import file_print
+import runtime
+from event_log import EventLogger
+from executor import CommandExecutor, Lane
+from reply import Table
+from outbox import Outbox
+from channel_directory import ChannelDirectory
+import schema
+from member_directory import directory
 from bot_info import SLACK_BOT_TOKEN, BOT_ID
 
+
+def report_startup(stage):
+    """Print how long the bot took to reach the given stage of the start up."""
+    print('startup: {0} after {1:.2f} s'.format(stage, time.monotonic() - start_time),
+          file=sys.stderr)
+
+
+report_startup('modules imported')
+# the time to the first handled message is reported once
+first_handled = threading.Event()
+
 # instantiate Slack clients
 slack_client = SlackClient(SLACK_BOT_TOKEN)
+# messages are sent through the outbox so that they are paced for Slack's rate limit
+outbox = Outbox(slack_client)
+
+# each thread has its own database connection, so that the commits and rollbacks of the commands
+# that run at the same time do not get mixed up
+db_local = threading.local()
+
+
+def connect():
+    """Return the database connection of the current thread."""
+    if not hasattr(db_local, 'db_conn'):
+        db_local.db_conn = sqlite3.connect('ayerslab.db', timeout=30)
+    return db_local.db_conn
+
 
-# read in database
-db_conn = sqlite3.connect('ayerslab.db')
-cursor = db_conn.cursor()
 # initiate database
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-if u'members' not in (j for i in cursor.fetchall() for j in i):
-    cursor.execute('CREATE TABLE members (id INTEGER PRIMARY KEY, name TEXT, userid TEXT NOT NULL, '
-                   'slack_id TEXT, email TEXT, role TEXT, permission TEXT, door_permission TEXT)')
-    db_conn.commit()
-
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-if u'doorlog' not in (j for i in cursor.fetchall() for j in i):
-    cursor.execute('''CREATE TABLE doorlog
-    (id INTEGER PRIMARY KEY,
-        time TEXT NOT NULL,
-        userid TEXT NOT NULL)''')
-    db_conn.commit()
-
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-if u'quietlog' not in (j for i in cursor.fetchall() for j in i):
-    cursor.execute('''CREATE TABLE quietlog
-    (id INTEGER PRIMARY KEY,
-        time TEXT NOT NULL,
-        userid TEXT NOT NULL)''')
-    db_conn.commit()
-
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-if u'group_meetings' not in (j for i in cursor.fetchall() for j in i):
-    cursor.execute('CREATE TABLE group_meetings (id INTEGER PRIMARY KEY, date TEXT NOT NULL, '
-                   'presenter INTEGER, chair INTEGER, title TEXT)')
-    db_conn.commit()
+schema.migrate(connect())
+report_startup('database ready')
+# write the door and quiet logs in the background
+event_logger = EventLogger('ayerslab.db')
+# run the commands on workers, so that a slow command does not hold up the door
+# the door goes first, then the interactive commands, and then the bulk jobs
+# the interactive commands and the bulk jobs take at most 3 of the 4 workers, so one is always left
+# for the door
+command_executor = CommandExecutor(max_workers=4, timeout=60,
+                                   lanes=[Lane('door', 50, None), Lane('interactive', 20, 2),
+                                          Lane('bulk', 5, 1)])
+# lane of the commands that start with the given words (the longest match is used)
+command_lanes = {
+    ('door', ): 'door',
+    ('members', ): 'interactive',
+    ('members', 'list'): 'bulk',
+    ('members', 'import_from_slack'): 'bulk',
+    ('quiet', ): 'interactive',
+    ('upload', ): 'bulk',
+    ('print', ): 'bulk',
+    ('print', 'status'): 'interactive',
+    ('print', 'cancel'): 'interactive',
+    ('stats', ): 'interactive',
+}
+# number of seconds after which the commands of each action are given up on
+timeouts = {'door': 10, 'quiet': 10, 'upload': 10, 'print': 30, 'members': 120}
+
+
+def compile_actions():
+    """Compile the commands that the bot understands.
+
+    Returns
+    -------
+    actions : action.ActionTable
+        Actions that are given to `action.act`.
+
+    """
+    # per-request values are injected when the action is executed
+    user = action.Inject('readable_user')
+    msg = action.Inject('msg')
+    shush_channel = action.Inject('shush_channel')
+    speak = action.Inject('speak')
+    db_conn = action.Inject('db_conn')
+    actions = {
+        'door': {
+            'open': ['', door.open_door, db_conn, user, event_logger],
+            '@': ['', door.open_door, db_conn, user, event_logger],
+            '#': ['', door.open_door, db_conn, user, event_logger],
+            'i': ['', door.open_door, db_conn, user, event_logger],
+            'abre': ['', door.open_door, db_conn, user, event_logger],
+            'ouvre': ['', door.open_door, db_conn, user, event_logger],
+            u'\u5f00\u95e8': ['', door.open_door, db_conn, user, event_logger],
+            'add': ['To add a user to access the door, you must provide an '
+                    'identification of the user, like their name or Slack id.',
+                    door.add, db_conn, user],
+        },
+        'members': {
+            'add': ['To add a member to the Ayer\'s lab group member database, you must'
+                    ' provide the name, userid, slack id, email, position of the '
+                    'new member, permission to the bot, and permission to the door in '
+                    'the given order. The entries are space delimited, which means that'
+                    ' you must encase multiword entries within quotes. '
+                    'If you are missing any of these information, just leave the '
+                    'information blank, i.e. \'\'.',
+                    members.add, db_conn, user],
+            'modify': ["To modify a member's information in the database, you must "
+                       "provide the column that you'd like to modify, the new value, "
+                       "and identifiers of the members (alternating between the column "
+                       "and its value).",
+                       members.modify, db_conn, user],
+            'list': ["To list the members' information in the database, you must "
+                     "provide the columns that you'd like to see.",
+                     members.list, db_conn],
+            'import_from_slack': ['', members.import_from_slack, slack_client, db_conn]
+        },
+        'quiet': ['', quiet.shush, outbox, db_conn, user, shush_channel, event_logger],
+        'stats': ['', command_stats],
+        'upload': ['', file_print.upload, msg, speak],
+        'print': {
+            'status': ['', file_print.print_status],
+            'cancel': ['To cancel a print job, you must provide the number of the job, which you '
+                       'can find with `print status`.',
+                       file_print.print_cancel, user],
+            None: ["To print a file, you must provide the filename of the file that "
+                   "you've uploaded. Then, you can provided print options in the "
+                   "following order: number of sides, which must be one of `single` or "
+                   "`double` (default is `double`); color, which must be one of `color` "
+                   "or `black` (default is `black`); quality, which must be one of "
+                   "`high` or `economy` (default is `economy`); and page numbers, which "
+                   "uses dashes to include multiple pages in an interval and commas to "
+                   "include separated pages (default is all pages). Since keyword "
+                   "arguments are not supported you must supply all arguments up until "
+                   "desired arugment to modify. For example, to specify print quality, "
+                   "you must provide the number of sides and color.",
+                   file_print.file_print, speak, user],
+        },
+        # 'meetings': {
+        # },
+        # 'money': {
+        # },
+        # 'random': {
+        # },
+    }
+    utils.make_errors(actions, None)
+    return action.ActionTable(actions)
+
+
+def command_stats():
+    """Show the number of waiting commands and how long they waited, for each lane."""
+    table = Table(['{: <13}', '{: <8}', '{: <9}', '{: <9}', '{: <15}', '{: <15}'],
+                  ['lane', 'queued', 'running', 'started', 'mean wait (s)', 'max wait (s)'])
+    for lane, stats in command_executor.stats().items():
+        table.add_row([lane, stats['queued'], stats['running'], stats['started'],
+                       '{:.2f}'.format(stats['mean_wait']), '{:.2f}'.format(stats['max_wait'])])
+    raise action.ActionInputError('\n{0}\n'.format(table))
+
+
+def command_lane(args):
+    """Return the lane of the command with the given arguments."""
+    words = tuple(i.lower() for i in args[:2])
+    for i in range(len(words), 0, -1):
+        if words[:i] in command_lanes:
+            return command_lanes[words[:i]]
+    return 'interactive'
+
+
+actions = compile_actions()
+
+
+def handle(msg):
+    """Respond to a message.
+
+    Parameters
+    ----------
+    msg : dict
+        Message parsed by `runtime.parse`.
+
+    """
+    # configure speak
+    def speak(message):
+        """Respond to the message."""
+        action.speak(outbox, msg['channel'], message, msg['user'])
+
+    if msg['message'].startswith(host):
+        args = msg['message'].replace(host, '')
+    else:
+        args = msg['message']
+
+    # parse the arguments
+    # errors must not leave this function, because they would stop the runtime
+    try:
+        args = shlex.split(args)
+    except ValueError as error:
+        speak('I could not understand the command ({0}). Quotes must come in pairs.'
+              ''.format(error))
+        return
+
+    # configure act
+    def act(arguments, **context):
+        """Act according to the message.
+
+        Parameters
+        ----------
+        arguments : arguments for the
+        """
+        try:
+            action.act(arguments, actions, **context)
+        except action.ActionInputError as error:
+            speak(str(error))
+        except Exception as error:
+            speak('I ENCOUNTERED AN UNEXPECTED ERROR. DEBUG ME HUMAN!')
+            raise error
+        finally:
+            if not first_handled.is_set():
+                first_handled.set()
+                report_startup('first message handled')
+
+    readable_user = directory.readable_user(connect().cursor(), msg['user'])
+
+    if msg['channel'] == channels.id('1door') and args[:1] != ['door']:
+        args = ['door'] + args
+
+    name = args[0].lower() if args else None
+
+    def time_out():
+        """Tell the user that the command is taking too long."""
+        speak('This is taking longer than {0} seconds. I will let you know when it is done.'
+              ''.format(timeouts.get(name, command_executor.timeout)))
+
+    # the commands of each user in a channel are run in order
+    try:
+        command_executor.submit((msg['channel'], msg['user']),
+                                lambda: act(args, readable_user=readable_user, msg=msg,
+                                            shush_channel=channels.id('shush'), speak=speak,
+                                            db_conn=connect()),
+                                lane=command_lane(args), timeout=timeouts.get(name),
+                                on_timeout=time_out)
+    except action.ActionInputError as error:
+        speak(str(error))
+
 
 if __name__ == "__main__":
+    # the channels are fetched while the RTM connection is made
+    channels = ChannelDirectory(slack_client, background=True)
     if slack_client.rtm_connect():
         print("ayerslab_bot connected and running!")
+        report_startup('connected')
         host = "<@{0}>".format(BOT_ID)
 
-        dict_channels = {i['name']: i['id']
-                         for i in slack_client.api_call("channels.list")['channels']}
-        while True:
-            raw_info = slack_client.rtm_read()
-
-            # parse messages (if info is a message that has been directly messaged to bot)
-            def msgs():
-                """Generate messages."""
-                for msg in raw_info:
-                    parsed_msg = {}
-
-                    if not msg['type'].startswith('message'):
-                        continue
-
-                    try:
-                        subtype = msg['subtype']
-                    except KeyError:
-                        if msg['user'] == BOT_ID:
-                            continue
-                        parsed_msg['message'] = msg['text'].strip()
-                    else:
-                        if subtype != 'file_share':
-                            continue
-                        parsed_msg['download'] = msg['file']['url_private_download']
-                        if 'initial_comment' in msg['file']:
-                            parsed_msg['message'] = msg['file']['initial_comment']['comment']
-                        else:
-                            parsed_msg['message'] = ''
-
-                    parsed_msg['user'] = msg['user']
-                    parsed_msg['channel'] = msg['channel']
-                    parsed_msg['time'] = msg['ts']
-                    yield parsed_msg
-
-            # process messages
-            for msg in msgs():
-                if msg['message'].startswith(host):
-                    args = msg['message'].replace(host, '')
-                else:
-                    args = msg['message']
-
-                # parse the arguments
-                args = shlex.split(args)
-
-                # configure speak
-                def speak(message):
-                    """Respond to the message."""
-                    action.speak(slack_client, msg['channel'], message, msg['user'])
-
-                # configure act
-                def act(arguments, actions):
-                    """Act according to the message.
-
-                    Parameters
-                    ----------
-                    arguments : arguments for the
-                    """
-                    utils.make_errors(actions, speak)
-                    try:
-                        action.act(arguments, actions)
-                    except action.ActionInputError as error:
-                        speak(str(error))
-                    except Exception as error:
-                        speak('I ENCOUNTERED AN UNEXPECTED ERROR. DEBUG ME HUMAN!')
-                        raise error
-
-                cursor.execute("SELECT userid FROM members WHERE slack_id = ?", (msg['user'],))
-                try:
-                    readable_user = cursor.fetchone()[0]
-                except (IndexError, TypeError):
-                    readable_user = msg['user']
-
-                if msg['channel'] == dict_channels['1door'] and args[0] != 'door':
-                    args = ['door'] + args
-
-                actions = {
-                    'door': {
-                        'open': ['', door.open_door, db_conn, readable_user],
-                        '@': ['', door.open_door, db_conn, readable_user],
-                        '#': ['', door.open_door, db_conn, readable_user],
-                        'i': ['', door.open_door, db_conn, readable_user],
-                        'abre': ['', door.open_door, db_conn, readable_user],
-                        'ouvre': ['', door.open_door, db_conn, readable_user],
-                        u'\u5f00\u95e8': ['', door.open_door, db_conn, readable_user],
-                        'add': ['To add a user to access the door, you must provide an '
-                                'identification of the user, like their name or Slack id.',
-                                door.add, db_conn, readable_user],
-                    },
-                    'members': {
-                        'add': ['To add a member to the Ayer\'s lab group member database, you must'
-                                ' provide the name, userid, slack id, email, position of the '
-                                'new member, permission to the bot, and permission to the door in '
-                                'the given order. The entries are space delimited, which means that'
-                                ' you must encase multiword entries within quotes. '
-                                'If you are missing any of these information, just leave the '
-                                'information blank, i.e. \'\'.',
-                                members.add, db_conn, readable_user],
-                        'modify': ["To modify a member's information in the database, you must "
-                                   "provide the column that you'd like to modify, the new value, "
-                                   "and identifiers of the members (alternating between the column "
-                                   "and its value).",
-                                   members.modify, db_conn, readable_user],
-                        'list': ["To list the members' information in the database, you must "
-                                 "provide the columns that you'd like to see.",
-                                 members.list, db_conn],
-                        'import_from_slack': ['', members.import_from_slack, slack_client, db_conn]
-                    },
-                    'quiet': ['', quiet.shush, slack_client, db_conn, readable_user,
-                              dict_channels['shush']],
-                    'upload': ['', file_print.upload, msg],
-                    'print': ["To print a file, you must provide the filename of the file that "
-                              "you've uploaded. Then, you can provided print options in the "
-                              "following order: number of sides, which must be one of `single` or "
-                              "`double` (default is `double`); color, which must be one of `color` "
-                              "or `black` (default is `black`); quality, which must be one of "
-                              "`high` or `economy` (default is `economy`); and page numbers, which "
-                              "uses dashes to include multiple pages in an interval and commas to "
-                              "include separated pages (default is all pages). Since keyword "
-                              "arguments are not supported you must supply all arguments up until "
-                              "desired arugment to modify. For example, to specify print quality, "
-                              "you must provide the number of sides and color.",
-                              file_print.file_print],
-                    # 'meetings': {
-                    # },
-                    # 'money': {
-                    # },
-                    # 'random': {
-                    # },
-                }
-                act(args, actions)
-
-            # 1 second delay between reading from firehose
-            time.sleep(1)
+        # RPi.GPIO is loaded in the background, so that the first door opening does not wait for it
+        threading.Thread(target=door.get_controller, name='door_setup', daemon=True).start()
+        try:
+            # the supervisor (live_control.py) tells us where to write the heartbeat
+            runtime.Runtime(slack_client, BOT_ID, handle, listeners=[channels.handle_event],
+                            heartbeat=os.environ.get('AYERSLAB_HEARTBEAT')).run_forever()
+        finally:
+            channels.close()
+            event_logger.close()
+            outbox.close(timeout=10)
     else:
         print("Connection failed. Invalid Slack token or bot ID?")
+        channels.close()
+        sys.exit(1)
@@ -1,9 +1,162 @@
+"""Supervisor that keeps the bot running.
+
+The bot (`live.py`) is restarted whenever it exits or its event loop stops touching the heartbeat
+file. Restarts are delayed with exponential backoff, so a bot that crashes on start does not keep
+the CPU busy, and a crash loop is waited out for longer. Restarts are reported to the status
+channel.
+
+"""
+import argparse
 import os
 import subprocess
+import sys
+import time
+
+
+class Supervisor:
+    """Runs the bot and restarts it when it dies or stalls.
+
+    Attributes
+    ----------
+    command : list of str
+        Command that runs the bot.
+    heartbeat : str
+        Path to the file that the bot touches while its event loop runs.
+    status_channel : str
+        Channel to which the restarts are reported, or None.
+    min_delay : float
+        Number of seconds before the first restart after a crash.
+    max_delay : float
+        Largest number of seconds before a restart. The delay doubles after every crash.
+    stable_time : float
+        Number of seconds that the bot must run for the delay to go back to `min_delay`.
+    stall_time : float
+        Number of seconds without a heartbeat after which the bot is taken to have stalled.
+    start_time : float
+        Number of seconds that the bot is given to start before its heartbeat is checked.
+    crash_loop : tuple of (int, float, float)
+        Number of crashes, within the given number of seconds, after which the supervisor waits for
+        the given number of seconds before it starts the bot again.
+    check_interval : float
+        Number of seconds between checks of the bot.
+
+    """
+    def __init__(self, command, heartbeat, status_channel=None, min_delay=1.0, max_delay=300.0,
+                 stable_time=600.0, stall_time=60.0, start_time=120.0,
+                 crash_loop=(5, 600.0, 1800.0), check_interval=5.0):
+        self.command = command
+        self.heartbeat = heartbeat
+        self.status_channel = status_channel
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.stable_time = stable_time
+        self.stall_time = stall_time
+        self.start_time = start_time
+        self.crash_loop = crash_loop
+        self.check_interval = check_interval
+        self.crashes = []
+        self._slack_client = None
+
+    def report(self, message):
+        """Print the message and post it to the status channel."""
+        print('live_control: {0}'.format(message), file=sys.stderr)
+        if self.status_channel is None:
+            return
+        try:
+            if self._slack_client is None:
+                from slackclient import SlackClient
+                from bot_info import SLACK_BOT_TOKEN
+                self._slack_client = SlackClient(SLACK_BOT_TOKEN)
+            self._slack_client.api_call('chat.postMessage', channel=self.status_channel,
+                                        text=message, as_user=True)
+        except Exception as error:
+            print('live_control: could not report to {0}: {1}'.format(self.status_channel, error),
+                  file=sys.stderr)
+
+    def _last_beat(self):
+        """Return the time of the last heartbeat, or None if there is none."""
+        try:
+            return os.path.getmtime(self.heartbeat)
+        except OSError:
+            return None
+
+    def run_once(self):
+        """Run the bot until it exits or stalls.
+
+        Returns
+        -------
+        reason : str
+            Why the bot stopped.
+
+        """
+        try:
+            os.remove(self.heartbeat)
+        except OSError:
+            pass
+        env = dict(os.environ, AYERSLAB_HEARTBEAT=self.heartbeat)
+        started = time.time()
+        process = subprocess.Popen(self.command, env=env)
+        reason = None
+        try:
+            while reason is None:
+                try:
+                    returncode = process.wait(timeout=self.check_interval)
+                except subprocess.TimeoutExpired:
+                    pass
+                else:
+                    return 'it exited with code {0}'.format(returncode)
+
+                now = time.time()
+                last_beat = self._last_beat()
+                if last_beat is None and now - started > self.start_time:
+                    reason = 'it did not start within {0:.0f} seconds'.format(self.start_time)
+                elif last_beat is not None and now - last_beat > self.stall_time:
+                    reason = 'it stalled for {0:.0f} seconds'.format(now - last_beat)
+        finally:
+            # the bot is also stopped if the supervisor is interrupted
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+        return reason
+
+    def run_forever(self):
+        """Keep the bot running."""
+        delay = self.min_delay
+        while True:
+            started = time.time()
+            reason = self.run_once()
+            now = time.time()
+            if now - started > self.stable_time:
+                delay = self.min_delay
+
+            max_crashes, crash_window, crash_loop_delay = self.crash_loop
+            self.crashes = [i for i in self.crashes if now - i < crash_window] + [now]
+            if len(self.crashes) >= max_crashes:
+                wait = crash_loop_delay
+                self.crashes = []
+                self.report('The bot stopped because {0}. It stopped {1} times in {2:.0f} minutes,'
+                            ' so I will restart it in {3:.0f} minutes.'
+                            ''.format(reason, max_crashes, crash_window / 60, wait / 60))
+            else:
+                wait = delay
+                self.report('The bot stopped because {0}. I will restart it in {1:.0f} seconds.'
+                            ''.format(reason, wait))
+            delay = min(delay * 2, self.max_delay)
+            time.sleep(wait)
+            self.report('Restarting the bot.')
+
 
-while True:
-    try:
-        path = os.path.dirname(os.path.realpath(__file__))
-        subprocess.call("python3 " + os.path.join(path, "live.py"), shell=True)
-    except Exception:
-        continue
+if __name__ == "__main__":
+    path = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description='Keep the bot running.')
+    parser.add_argument('--status-channel', default=os.environ.get('AYERSLAB_STATUS_CHANNEL'),
+                        help='Channel to which the restarts are reported.')
+    parser.add_argument('--heartbeat', default=os.path.join(path, 'ayerslab.heartbeat'),
+                        help='File that the bot touches while it runs.')
+    args = parser.parse_args()
+    Supervisor([sys.executable, os.path.join(path, 'live.py')], args.heartbeat,
+               status_channel=args.status_channel).run_forever()
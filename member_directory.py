@@ -0,0 +1,158 @@
+"""Process-wide cache of the identities and permissions of the group members."""
+from collections import namedtuple
+import threading
+
+
+DoorIndex = namedtuple('DoorIndex', ['allowed', 'ambiguous'])
+DoorIndex.__doc__ = """Identifications that are checked when someone wants to open the door.
+
+Attributes
+----------
+allowed : frozenset of str
+    Identifications (name, userid, slack id, and id) that belong to exactly one member and whose
+    member has the door permission, 'yesdoor'.
+ambiguous : frozenset of str
+    Identifications that belong to more than one member.
+
+"""
+
+
+class MemberDirectory:
+    """In-memory copy of the identification and permission columns of the members table.
+
+    The directory is loaded from the database on first use and is reloaded after it is invalidated.
+    Every function that writes to the members table must call `load` (or `invalidate`) after
+    committing.
+
+    Attributes
+    ----------
+    members : dict of int to tuple
+        Dictionary of the database id to the tuple of id, name, userid, slack id, permission, and
+        door permission of the member.
+    identifiers : dict of str to list of int
+        Dictionary of each identification (name, userid, slack id, or id) to the database ids of the
+        members that go by it.
+    userids : dict of str to str
+        Dictionary of the slack id to the userid.
+    door : DoorIndex
+        Identifications that can open the door and identifications that are ambiguous.
+
+    """
+    columns = ('id', 'name', 'userid', 'slack_id', 'permission', 'door_permission')
+
+    def __init__(self):
+        self.members = {}
+        self.identifiers = {}
+        self.userids = {}
+        self.door = DoorIndex(frozenset(), frozenset())
+        self.is_loaded = False
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        """Mark the directory as stale so that it is reloaded before the next lookup.
+
+        Functions that change the members table should rather call `load` so that the next lookup
+        does not have to wait for the database.
+
+        """
+        with self._lock:
+            self.is_loaded = False
+
+    def load(self, cursor):
+        """Load the directory from the database.
+
+        Parameters
+        ----------
+        cursor : sqlite3.Cursor
+            Cursor object used to retrieve infromation from the database.
+
+        """
+        with self._lock:
+            members = {}
+            identifiers = {}
+            userids = {}
+            cursor.execute('SELECT {0} FROM members ORDER BY id'.format(', '.join(self.columns)))
+            for row in cursor.fetchall():
+                members[row[0]] = row
+                # a member that goes by the same identification twice is only counted once
+                for identifier in set(str(i) for i in row[:4] if i is not None):
+                    identifiers.setdefault(identifier, []).append(row[0])
+                if row[3] is not None:
+                    userids.setdefault(row[3], row[2])
+            door = DoorIndex(frozenset(i for i, ids in identifiers.items()
+                                       if len(ids) == 1 and members[ids[0]][5] == 'yesdoor'),
+                             frozenset(i for i, ids in identifiers.items() if len(ids) > 1))
+            self.members = members
+            self.identifiers = identifiers
+            self.userids = userids
+            self.door = door
+            self.is_loaded = True
+
+    def ensure_loaded(self, cursor):
+        """Load the directory if it is stale."""
+        with self._lock:
+            if not self.is_loaded:
+                self.load(cursor)
+
+    def find(self, cursor, user):
+        """Find the members that go by the given identification.
+
+        Parameters
+        ----------
+        cursor : sqlite3.Cursor
+            Cursor object used to load the directory if it is stale.
+        user : str
+            Identification of the user.
+            Can be name, userid, slack id or id.
+
+        Returns
+        -------
+        rows : list of tuple
+            Id, name, userid, slack id, permission, and door permission of each member.
+
+        """
+        with self._lock:
+            self.ensure_loaded(cursor)
+            return [self.members[i] for i in self.identifiers.get(str(user), [])]
+
+    def door_index(self, cursor):
+        """Return the index used to check if someone can open the door.
+
+        Parameters
+        ----------
+        cursor : sqlite3.Cursor
+            Cursor object used to load the directory if it is stale.
+
+        Returns
+        -------
+        door : DoorIndex
+            Index that is replaced (not modified) when the directory is reloaded, so it can be used
+            without holding any lock.
+
+        """
+        with self._lock:
+            self.ensure_loaded(cursor)
+            return self.door
+
+    def readable_user(self, cursor, slack_id):
+        """Return the userid of the member with the given slack id.
+
+        Parameters
+        ----------
+        cursor : sqlite3.Cursor
+            Cursor object used to load the directory if it is stale.
+        slack_id : str
+            Slack id of the user.
+
+        Returns
+        -------
+        userid : str
+            Userid of the member, or the given slack id if the member is not in the database.
+
+        """
+        with self._lock:
+            self.ensure_loaded(cursor)
+            return self.userids.get(slack_id, slack_id)
+
+
+directory = MemberDirectory()
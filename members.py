@@ -1,5 +1,8 @@
 """Module for managing group member database."""
+import sqlite3
 from action import ActionInputError
+from member_directory import directory
+from reply import Table
 import utils
 
 
@@ -15,15 +18,13 @@ def has_permission(cursor, user):
         Can be name, userid, slack id or id.
 
     """
-    cursor.execute('SELECT permission FROM members WHERE name=? OR userid=? OR slack_id=? OR '
-                   'id=?', (user,)*4)
-    rows = cursor.fetchall()
+    rows = directory.find(cursor, user)
 
     if len(rows) > 1:
         raise ActionInputError('I found more than one person that goes by the identification, {0}'
                                ''.format(user))
     else:
-        return len(rows) == 1 and rows[0][0] == 'admin'
+        return len(rows) == 1 and rows[0][4] == 'admin'
 
 
 def add(db_conn, user, name, userid, slack_id, email, role, permission, door_permission):
@@ -53,12 +54,20 @@ def add(db_conn, user, name, userid, slack_id, email, role, permission, door_per
         One of 'yesdoor' or  'nodoor'
 
     """
+    # empty names and slack ids are stored as NULL so that they do not clash with one another
+    name = name if name != '' else None
+    slack_id = slack_id if slack_id != '' else None
     cursor = db_conn.cursor()
     if has_permission(cursor, user):
-        cursor.execute('INSERT INTO members (name, userid, slack_id, email, role, permission,'
-                       ' door_permission) VALUES (?,?,?,?,?,?,?)',
-                       (name, userid, slack_id, email, role, permission, door_permission))
+        try:
+            cursor.execute('INSERT INTO members (name, userid, slack_id, email, role, permission,'
+                           ' door_permission) VALUES (?,?,?,?,?,?,?)',
+                           (name, userid, slack_id, email, role, permission, door_permission))
+        except sqlite3.IntegrityError:
+            raise ActionInputError('Someone with the same userid or slack id is already in '
+                                   'the database.')
         db_conn.commit()
+        directory.load(cursor)
     else:
         raise ActionInputError("You do not have the permission to add a new user.")
 
@@ -97,8 +106,12 @@ def modify(db_conn, user, item, to_val, *identifiers):
                                'Could you be more specific?')
     elif (has_permission(cursor, user) or
           (user in rows[0] and item not in ['permission', 'door_permission'])):
-        cursor.execute('UPDATE members SET {0}=? WHERE id=?'.format(item), (to_val, rows[0][0]))
+        try:
+            cursor.execute('UPDATE members SET {0}=? WHERE id=?'.format(item), (to_val, rows[0][0]))
+        except sqlite3.IntegrityError:
+            raise ActionInputError('Someone else already goes by the {0}, {1}'.format(item, to_val))
         db_conn.commit()
+        directory.load(cursor)
         raise ActionInputError('Bleep bloop')
     else:
         raise ActionInputError("You do not have the permission to modify this user's information")
@@ -140,42 +153,102 @@ def list(db_conn, *column_identifiers):
     if len(diff) != 0:
         raise ActionInputError('I could not find any information that goes by {0}'.format(diff))
 
-    message_format = u''.join(col_formats[i] for i in column_identifiers) + u'\n'
-    message = message_format.format(*[col_names[i] for i in column_identifiers])
+    table = Table([col_formats[i] for i in column_identifiers],
+                  [col_names[i] for i in column_identifiers])
+    table.add_rows(cursor.execute('SELECT {0} FROM members'.format(', '.join(column_identifiers))))
+
+    raise ActionInputError('\n{0}\n'.format(table))
+
+
+def slack_users(slack_client, page_size=200):
+    """Yield every user of the Slack team, following the cursors of `users.list`.
+
+    Parameters
+    ----------
+    slack_client : SlackClient
+        Slack client that is used to list the users.
+    page_size : int
+        Number of users that are requested at once.
 
-    for row in cursor.execute('SELECT {0} FROM members'.format(', '.join(column_identifiers))):
-        # construct message
-        message += message_format.format(*row)
+    Raises
+    ------
+    ActionInputError
+        If Slack does not list the users.
 
-    raise ActionInputError('\n' + message)
+    """
+    next_cursor = None
+    while True:
+        kwargs = {'limit': page_size}
+        if next_cursor:
+            kwargs['cursor'] = next_cursor
+        response = slack_client.api_call('users.list', **kwargs)
+        if not response.get('ok', True):
+            raise ActionInputError('I could not get the members from Slack: {0}'
+                                   ''.format(response.get('error')))
+        for user in response['members']:
+            yield user
+        next_cursor = response.get('response_metadata', {}).get('next_cursor')
+        if not next_cursor:
+            break
 
 
 def import_from_slack(slack_client, db_conn):
-    """Import the group member information from Slack Client."""
-    names = []
-    userids = []
-    slack_ids = []
-    emails = []
-    roles = []
-    permissions = []
-    doors = []
+    """Import the group member information from Slack Client.
+
+    Members are matched to the Slack users by their Slack id, or by their userid if they do not
+    have a Slack id yet. New users are added, and the name, userid, and email of the matched members
+    are updated if they changed on Slack. Users whose userid or Slack id belongs to another member
+    are skipped.
 
+    """
     cursor = db_conn.cursor()
 
-    for i in slack_client.api_call('users.list')['members']:
-        # check if already in database
-        cursor.execute("SELECT id FROM members WHERE slack_id = ?", (i['name'],))
-        if cursor.fetchone():
+    # index the members that are already in the database
+    by_slack_id = {}
+    by_userid = {}
+    for row in cursor.execute('SELECT id, slack_id, userid, name, email FROM members'):
+        if row[1] is not None:
+            by_slack_id[row[1]] = row
+        if row[2] is not None:
+            by_userid[row[2]] = row
+
+    new_rows = []
+    changed_rows = []
+    num_same = 0
+    for i in slack_users(slack_client):
+        profile = i.get('profile', {})
+        slack_row = (i['id'], i['name'], profile.get('real_name') or None, profile.get('email', ''))
+        row = by_slack_id.get(i['id'])
+        if row is None:
+            row = by_userid.get(i['name'])
+            if row is not None and row[1] is not None:
+                # the userid belongs to another Slack user
+                row = None
+        if row is None:
+            new_rows.append(slack_row + ('', 'user', 'nodoor'))
             continue
-
-        names.append(i['profile'].get('real_name', ''))
-        userids.append(i['name'])
-        slack_ids.append(i['id'])
-        emails.append(i['profile'].get('email', ''))
-        roles.append('')
-        permissions.append('user')
-        doors.append('nodoor')
-    cursor.executemany('INSERT INTO members (name, userid, slack_id, email, role, permission, '
-                       'door_permission) VALUES (?,?,?,?,?,?,?)',
-                       zip(names, userids, slack_ids, emails, roles, permissions, doors))
-    db_conn.commit()
+        # empty fields on Slack do not erase the ones in the database
+        changes = tuple(j if j else k for j, k in zip(slack_row, row[1:]))
+        if changes == row[1:]:
+            num_same += 1
+        else:
+            changed_rows.append(changes + (row[0],))
+
+    try:
+        # people whose userid or slack id is already in the database are skipped
+        num_changes = db_conn.total_changes
+        cursor.executemany('UPDATE OR IGNORE members SET slack_id=?, userid=?, name=?, email=?'
+                           ' WHERE id=?', changed_rows)
+        num_updated = db_conn.total_changes - num_changes
+        cursor.executemany('INSERT OR IGNORE INTO members (slack_id, userid, name, email, role, '
+                           'permission, door_permission) VALUES (?,?,?,?,?,?,?)', new_rows)
+        num_inserted = db_conn.total_changes - num_changes - num_updated
+        db_conn.commit()
+    except sqlite3.Error:
+        db_conn.rollback()
+        raise
+    directory.load(cursor)
+
+    num_skipped = num_same + len(changed_rows) + len(new_rows) - num_updated - num_inserted
+    raise ActionInputError('I added {0}, updated {1}, and skipped {2} members from Slack.'
+                           ''.format(num_inserted, num_updated, num_skipped))
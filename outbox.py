@@ -0,0 +1,190 @@
+"""Module for sending messages to Slack without going over its rate limit."""
+import collections
+import sys
+import threading
+import time
+import reply
+
+
+class Outbox:
+    """Queue of outgoing Slack messages that are sent from a background thread.
+
+    Each channel has its own queue and its own token bucket, so a busy channel does not hold up the
+    others. Messages that pile up in the queue of a channel are merged into a single post. When
+    Slack answers with `ratelimited`, the channel is paused for as long as its `Retry-After` header
+    says.
+
+    A message that is longer than `message_limit` is split at its line breaks into several posts,
+    so that tables are not cut off by Slack. A message that is longer than `snippet_limit` is
+    uploaded as a text snippet instead.
+
+    The outbox can be used in place of a SlackClient: `chat.postMessage` calls made through
+    `api_call` are queued, and all other calls are passed on to the client.
+
+    Attributes
+    ----------
+    slack_client : SlackClient
+        Slack client that sends the messages.
+    rate : float
+        Number of messages per second that are sent to each channel in the long run.
+    burst : int
+        Number of messages that can be sent to a channel at once after it has been quiet.
+    merge_limit : int
+        Maximum number of characters of a post that is made by merging queued messages.
+    message_limit : int
+        Maximum number of characters of a post.
+    snippet_limit : int
+        Maximum number of characters of a message that is sent as posts rather than a snippet.
+
+    """
+    def __init__(self, slack_client, rate=1.0, burst=3, merge_limit=1000, message_limit=4000,
+                 snippet_limit=12000):
+        self.slack_client = slack_client
+        self.rate = rate
+        self.burst = burst
+        self.merge_limit = min(merge_limit, message_limit)
+        self.message_limit = message_limit
+        self.snippet_limit = snippet_limit
+        self._queues = collections.OrderedDict()
+        self._buckets = {}
+        self._paused = {}
+        self._sending = 0
+        self._is_closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='outbox', daemon=True)
+        self._thread.start()
+
+    def post(self, channel, text, **kwargs):
+        """Queue a message.
+
+        Parameters
+        ----------
+        channel : str
+            Id of the channel.
+        text : str
+            Message.
+        kwargs : dict
+            Other arguments of `chat.postMessage`. Only messages with the same arguments are merged.
+
+        """
+        if len(text) <= self.message_limit or len(text) > self.snippet_limit:
+            parts = [text]
+        else:
+            parts = reply.split(text, self.message_limit)
+        with self._condition:
+            self._queues.setdefault(channel, collections.deque()).extend(
+                (i, kwargs) for i in parts)
+            self._condition.notify_all()
+
+    def api_call(self, method, **kwargs):
+        """Queue the message if the method is `chat.postMessage`, otherwise call the Slack API."""
+        if method != 'chat.postMessage':
+            return self.slack_client.api_call(method, **kwargs)
+        channel = kwargs.pop('channel')
+        text = kwargs.pop('text', '')
+        self.post(channel, text, **kwargs)
+        return {'ok': True, 'channel': channel, 'queued': True}
+
+    def pending(self):
+        """Return the number of messages that have not been sent yet."""
+        with self._condition:
+            return sum(len(i) for i in self._queues.values()) + self._sending
+
+    def flush(self, timeout=None):
+        """Wait until all of the queued messages are sent.
+
+        Returns
+        -------
+        is_flushed : bool
+            False if the timeout ran out before all of the messages were sent.
+
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queues and not self._sending,
+                                            timeout)
+
+    def close(self, timeout=None):
+        """Send the remaining messages and stop the background thread."""
+        self.flush(timeout)
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _wait_time(self, channel, now):
+        """Return the number of seconds until a message can be sent to the channel."""
+        paused = self._paused.get(channel, 0) - now
+        tokens, last_time = self._buckets.get(channel, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last_time) * self.rate)
+        self._buckets[channel] = (tokens, now)
+        return max(paused, (1 - tokens) / self.rate, 0)
+
+    def _take(self, channel):
+        """Remove the next post of a channel, merging the queued messages that fit into it."""
+        queue = self._queues[channel]
+        text, kwargs = queue.popleft()
+        while (queue and queue[0][1] == kwargs and
+               len(text) + 1 + len(queue[0][0]) <= self.merge_limit):
+            text = '{0}\n{1}'.format(text, queue.popleft()[0])
+        if not queue:
+            del self._queues[channel]
+        tokens, last_time = self._buckets[channel]
+        self._buckets[channel] = (tokens - 1, last_time)
+        return text, kwargs
+
+    def _send(self, channel, text, kwargs):
+        """Send a post, or upload it as a snippet if it is too long.
+
+        Returns
+        -------
+        retry_after : float
+            Number of seconds to wait before the post is sent again, or None if it should not be
+            sent again.
+
+        """
+        try:
+            if len(text) > self.message_limit:
+                response = self.slack_client.api_call('files.upload', channels=channel,
+                                                      content=text, filetype='text')
+            else:
+                response = self.slack_client.api_call('chat.postMessage', channel=channel,
+                                                      text=text, **kwargs)
+        except Exception as error:
+            print('Could not send a message to {0}: {1}'.format(channel, error), file=sys.stderr)
+            return None
+        if response.get('ok', True) or response.get('error') != 'ratelimited':
+            return None
+        try:
+            return float(response.get('headers', {}).get('Retry-After', 1))
+        except ValueError:
+            return 1.0
+
+    def _run(self):
+        """Send the queued messages of each channel as fast as its rate limit allows."""
+        with self._condition:
+            while True:
+                if self._is_closed:
+                    return
+                now = time.monotonic()
+                wait_times = {i: self._wait_time(i, now) for i in self._queues}
+                ready = [i for i, wait_time in wait_times.items() if wait_time == 0]
+                if not ready:
+                    self._condition.wait(min(wait_times.values()) if wait_times else None)
+                    continue
+
+                # send one post to each channel that is ready, taking turns between the channels
+                for channel in ready:
+                    text, kwargs = self._take(channel)
+                    self._sending += 1
+                    self._condition.release()
+                    try:
+                        retry_after = self._send(channel, text, kwargs)
+                    finally:
+                        self._condition.acquire()
+                        self._sending -= 1
+                    if retry_after is not None:
+                        self._paused[channel] = time.monotonic() + retry_after
+                        self._queues.setdefault(channel, collections.deque()).appendleft(
+                            (text, kwargs))
+                        self._queues.move_to_end(channel, last=False)
+                self._condition.notify_all()
@@ -2,7 +2,7 @@ import datetime
 import action
 
 
-def shush(client, db_conn, user, channel):
+def shush(client, db_conn, user, channel, logger=None):
     """Tell people to be quiet.
 
     Parameters
@@ -15,10 +15,16 @@ def shush(client, db_conn, user, channel):
         User that requests people to be quiet.
     channel : str
         Channel that will be shushed.
+    logger : event_log.EventLogger
+        Logger that writes the request to the quiet log in the background.
+        Default writes the request to the quiet log before returning.
 
     """
-    db_conn.execute("INSERT INTO quietlog (time, userid) VALUES (?,?)",
-                    (str(datetime.datetime.now()), user))
-    db_conn.commit()
     action.speak(client, channel, 'Shhhhhh', '')
+    if logger is not None:
+        logger.log('quietlog', user)
+    else:
+        db_conn.execute("INSERT INTO quietlog (time, userid) VALUES (?,?)",
+                        (str(datetime.datetime.now()), user))
+        db_conn.commit()
     raise action.ActionInputError('Bleep bloop.')
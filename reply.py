@@ -0,0 +1,86 @@
+"""Module for rendering long replies, such as tables, so that they fit into Slack messages."""
+
+
+class Table:
+    """Table of fixed width columns that is rendered one row at a time.
+
+    The rows are kept as a list of lines and joined only once, so adding a row takes the same time
+    no matter how large the table is.
+
+    Attributes
+    ----------
+    row_format : str
+        Format of a row, with one field per column.
+    lines : list of str
+        Rendered rows, starting with the header.
+
+    """
+    def __init__(self, formats, header):
+        """
+        Parameters
+        ----------
+        formats : list of str
+            Format of each column, e.g. '{: <20}'.
+        header : list of str
+            Title of each column.
+
+        """
+        self.row_format = ''.join(formats)
+        self.lines = [self.row_format.format(*header)]
+
+    def add_row(self, row):
+        """Render a row. None is shown as an empty field."""
+        self.lines.append(self.row_format.format(*['' if i is None else i for i in row]))
+
+    def add_rows(self, rows):
+        """Render each row of an iterable, such as a database cursor."""
+        for row in rows:
+            self.add_row(row)
+
+    def add_line(self, line):
+        """Add a line that is not a row, such as a footer."""
+        self.lines.append(line)
+
+    def __str__(self):
+        return '\n'.join(self.lines)
+
+
+def split(text, limit):
+    """Split a text into parts that are at most the given number of characters.
+
+    The text is split at line breaks, so rows of a table are never broken across parts. A single
+    line that is longer than the limit is broken into pieces of the limit.
+
+    Parameters
+    ----------
+    text : str
+        Text that is split.
+    limit : int
+        Largest number of characters of a part.
+
+    Returns
+    -------
+    parts : list of str
+        Parts of the text, without the line breaks at which it was split.
+        Parts that would only hold blank lines are left out, since Slack does not post empty
+        messages.
+
+    """
+    parts = []
+    lines = []
+    size = -1
+    for line in text.split('\n'):
+        while len(line) > limit:
+            line, rest = line[:limit], line[limit:]
+            if lines:
+                parts.append('\n'.join(lines))
+            parts.append(line)
+            lines, size, line = [], -1, rest
+        if size + 1 + len(line) > limit:
+            parts.append('\n'.join(lines))
+            lines, size = [], -1
+        lines.append(line)
+        size += 1 + len(line)
+    if lines:
+        parts.append('\n'.join(lines))
+    return [part for part in parts if part.strip()]
@@ -0,0 +1,161 @@
+"""Event-driven runtime that feeds Slack RTM messages to the bot."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+
+def parse(raw_info, bot_id):
+    """Generate the messages that the bot should respond to.
+
+    Parameters
+    ----------
+    raw_info : list of dict
+        Events returned by `SlackClient.rtm_read`.
+    bot_id : str
+        Slack id of the bot. Messages from the bot itself are skipped.
+
+    Yields
+    ------
+    parsed_msg : dict
+        Dictionary with the keys 'message', 'user', 'channel', and 'time'. Messages that come with
+        a file also contain the key 'download'.
+
+    """
+    for msg in raw_info:
+        parsed_msg = {}
+
+        if not msg.get('type', '').startswith('message'):
+            continue
+
+        try:
+            subtype = msg['subtype']
+        except KeyError:
+            if msg['user'] == bot_id:
+                continue
+            parsed_msg['message'] = msg['text'].strip()
+        else:
+            if subtype != 'file_share':
+                continue
+            parsed_msg['download'] = msg['file']['url_private_download']
+            if 'initial_comment' in msg['file']:
+                parsed_msg['message'] = msg['file']['initial_comment']['comment']
+            else:
+                parsed_msg['message'] = ''
+
+        parsed_msg['user'] = msg['user']
+        parsed_msg['channel'] = msg['channel']
+        parsed_msg['time'] = msg['ts']
+        yield parsed_msg
+
+
+class Runtime:
+    """Asyncio loop that wakes up on incoming RTM frames and handles each message as its own task.
+
+    Attributes
+    ----------
+    slack_client : SlackClient
+        Slack client that is connected to the RTM websocket.
+    bot_id : str
+        Slack id of the bot.
+    handler : function
+        Function that takes a parsed message (see `parse`) and responds to it.
+        It is run in a worker thread so that a slow command does not hold up the other messages.
+    loop : asyncio.AbstractEventLoop
+        Event loop that drives the runtime.
+    executor : concurrent.futures.Executor
+        Pool of workers that runs the handler.
+    keepalive : float
+        Number of seconds between reads of the websocket when no frame has arrived. This catches
+        frames that are buffered by the SSL layer and lets the client notice a dropped connection.
+    listeners : list of function
+        Functions that are called with every RTM event (not only the messages) as soon as it is
+        read, e.g. `ChannelDirectory.handle_event`. They are run on the event loop and must be fast.
+    heartbeat : str
+        Path to a file that is touched by the event loop at least every `keepalive` seconds, so that
+        a supervisor (see `live_control.py`) can tell that the loop has stalled.
+        None if there is no heartbeat.
+
+    """
+    def __init__(self, slack_client, bot_id, handler, loop=None, executor=None, keepalive=5.0,
+                 listeners=(), heartbeat=None):
+        self.slack_client = slack_client
+        self.bot_id = bot_id
+        self.handler = handler
+        self.listeners = list(listeners)
+        self.loop = loop if loop is not None else asyncio.new_event_loop()
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=8)
+        self.keepalive = keepalive
+        self.heartbeat = heartbeat
+        self._failure = None
+
+    def read(self):
+        """Read all available frames from the websocket and schedule a task for each message."""
+        try:
+            raw_info = self.slack_client.rtm_read()
+        except Exception as error:
+            self.fail(error)
+            return
+        for event in raw_info:
+            for listener in self.listeners:
+                listener(event)
+        for msg in parse(raw_info, self.bot_id):
+            self.loop.create_task(self.dispatch(msg))
+
+    async def dispatch(self, msg):
+        """Run the handler on the given message in a worker thread.
+
+        Unexpected errors stop the runtime, just as they would stop a blocking loop.
+
+        """
+        try:
+            await self.loop.run_in_executor(self.executor, self.handler, msg)
+        except Exception as error:
+            self.fail(error)
+
+    def beat(self):
+        """Touch the heartbeat file."""
+        if self.heartbeat is None:
+            return
+        with open(self.heartbeat, 'a'):
+            pass
+        os.utime(self.heartbeat, (time.time(), time.time()))
+
+    def fail(self, error):
+        """Stop the runtime because of the given error."""
+        if self._failure is not None and not self._failure.done():
+            self._failure.set_exception(error)
+
+    def _socket(self):
+        """Return the socket of the RTM websocket or None if it cannot be watched."""
+        try:
+            sock = self.slack_client.server.websocket.sock
+            sock.fileno()
+        except AttributeError:
+            return None
+        return sock
+
+    async def serve(self):
+        """Respond to the messages until an unexpected error occurs."""
+        self._failure = self.loop.create_future()
+        sock = self._socket()
+        if sock is not None:
+            self.loop.add_reader(sock, self.read)
+        try:
+            while not self._failure.done():
+                # read regularly even if nothing woke us up
+                self.read()
+                self.beat()
+                await asyncio.wait([self._failure], timeout=self.keepalive if sock else 0.1)
+            self._failure.result()
+        finally:
+            if sock is not None:
+                self.loop.remove_reader(sock)
+
+    def run_forever(self):
+        """Run the event loop until an unexpected error occurs."""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,173 @@
+"""Module for creating and upgrading the database of the bot.
+
+The version of the database is stored in `PRAGMA user_version`. Each migration upgrades the
+database by one version and is run in its own transaction, so an existing database is upgraded in
+place the first time that the new code connects to it.
+
+"""
+from datetime import datetime
+import re
+import sqlite3
+
+
+def create_tables(cursor):
+    """Create the tables that the bot uses, if they do not exist already."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS members (id INTEGER PRIMARY KEY, name TEXT, '
+                   'userid TEXT NOT NULL, slack_id TEXT, email TEXT, role TEXT, permission TEXT, '
+                   'door_permission TEXT)')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS doorlog
+    (id INTEGER PRIMARY KEY,
+        time TEXT NOT NULL,
+        userid TEXT NOT NULL)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS quietlog
+    (id INTEGER PRIMARY KEY,
+        time TEXT NOT NULL,
+        userid TEXT NOT NULL)''')
+    cursor.execute('CREATE TABLE IF NOT EXISTS group_meetings (id INTEGER PRIMARY KEY, '
+                   'date TEXT NOT NULL, presenter INTEGER, chair INTEGER, title TEXT)')
+
+
+def merge_duplicate_members(cursor, column):
+    """Merge the members that share the same value of the given column.
+
+    The member with the smallest id is kept. Its empty columns are filled in with the information of
+    the other members and the group meetings of the other members are given to it.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        Cursor object used to modify the database.
+    column : str
+        Column of the members table that identifies a person.
+
+    """
+    cursor.execute("SELECT {0} FROM members WHERE {0} IS NOT NULL AND {0} != '' GROUP BY {0} "
+                   "HAVING COUNT(*) > 1".format(column))
+    for value, in cursor.fetchall():
+        cursor.execute('SELECT * FROM members WHERE {0}=? ORDER BY id'.format(column), (value,))
+        col_names = [i[0] for i in cursor.description]
+        rows = cursor.fetchall()
+        keep = list(rows[0])
+        for row in rows[1:]:
+            keep = [i if i not in (None, '') else j for i, j in zip(keep, row)]
+        others = [row[0] for row in rows[1:]]
+
+        marks = ','.join('?' * len(others))
+        cursor.execute('DELETE FROM members WHERE id IN ({0})'.format(marks), others)
+        cursor.execute('UPDATE members SET {0} WHERE id=?'
+                       ''.format(', '.join('{0}=?'.format(i) for i in col_names[1:])),
+                       keep[1:] + keep[:1])
+        for job in ['presenter', 'chair']:
+            cursor.execute('UPDATE group_meetings SET {0}=? WHERE {0} IN ({1})'.format(job, marks),
+                           [keep[0]] + others)
+
+
+def create_indexes(cursor):
+    """Create the indexes on the columns that are used to look up members and group meetings.
+
+    Members that were imported more than once from Slack are merged, because the slack id and the
+    userid of a person are unique within Slack. Empty names and slack ids are replaced with NULL,
+    which the unique indexes allow more than once. Userids cannot be NULL, so the empty ones (the
+    members that were added without one) are left out of their unique index. Names are not unique,
+    since two people can share a name.
+
+    """
+    for column in ['name', 'slack_id']:
+        cursor.execute("UPDATE members SET {0}=NULL WHERE {0}=''".format(column))
+    merge_duplicate_members(cursor, 'slack_id')
+    merge_duplicate_members(cursor, 'userid')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS members_slack_id ON members (slack_id)')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS members_userid ON members (userid) "
+                   "WHERE userid != ''")
+    cursor.execute('CREATE INDEX IF NOT EXISTS members_name ON members (name)')
+    for column in ['date', 'presenter', 'chair']:
+        cursor.execute('CREATE INDEX IF NOT EXISTS group_meetings_{0} ON group_meetings ({0})'
+                       ''.format(column))
+
+
+def create_member_absences(cursor):
+    """Create the table of the dates on which members are away.
+
+    Each row is one absence of a member from `start` to `end` (inclusive), written as yyyy-mm-dd.
+    Absences that were written into the text column `members.dates_away` are moved into the table.
+    Consecutive dates in the text are taken as the two ends of an absence, and a date without a
+    partner is taken as a single day.
+
+    """
+    cursor.execute('CREATE TABLE IF NOT EXISTS member_absences (id INTEGER PRIMARY KEY, '
+                   'member_id INTEGER NOT NULL, start TEXT NOT NULL, end TEXT NOT NULL)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS member_absences_range ON member_absences '
+                   '(start, end)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS member_absences_member ON member_absences '
+                   '(member_id, start, end)')
+
+    cursor.execute('PRAGMA table_info(members)')
+    if 'dates_away' not in [i[1] for i in cursor.fetchall()]:
+        return
+    absences = []
+    cursor.execute('SELECT id, dates_away FROM members WHERE dates_away IS NOT NULL')
+    for member_id, dates_away in cursor.fetchall():
+        dates = []
+        for date in re.findall(r'\d\d\d\d-\d\d-\d\d', dates_away):
+            try:
+                dates.append(datetime.strptime(date, '%Y-%m-%d').date().isoformat())
+            except ValueError:
+                continue
+        for i in range(0, len(dates), 2):
+            ends = sorted(dates[i:i + 2])
+            absences.append((member_id, ends[0], ends[-1]))
+    cursor.executemany('INSERT INTO member_absences (member_id, start, end) VALUES (?,?,?)',
+                       absences)
+
+
+def create_timed_actions(cursor):
+    """Create the table of the commands that the bot repeats in some time interval.
+
+    Each row is one command, given by the name of the action, the option, the inputs (as a JSON
+    list), and the interval in seconds, together with the times (in seconds since the epoch) at
+    which it last ran and at which it runs next.
+
+    """
+    cursor.execute('CREATE TABLE IF NOT EXISTS timed_actions (id INTEGER PRIMARY KEY, '
+                   'action TEXT NOT NULL, option TEXT NOT NULL, inputs TEXT NOT NULL, '
+                   'interval INTEGER NOT NULL, last_time REAL, next_time REAL NOT NULL, '
+                   'UNIQUE (action, option, inputs, interval))')
+
+
+migrations = [create_tables, create_indexes, create_member_absences, create_timed_actions]
+
+
+def version(db_conn):
+    """Return the version of the schema of the given database."""
+    return db_conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db_conn):
+    """Upgrade the given database to the latest version of the schema.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+
+    Raises
+    ------
+    sqlite3.IntegrityError
+        If the database cannot be upgraded because of its contents. The database is left at the
+        last version that was successfully reached.
+
+    """
+    current_version = version(db_conn)
+    if current_version >= len(migrations):
+        return
+    cursor = db_conn.cursor()
+    db_conn.commit()
+    for i, migration in enumerate(migrations[current_version:], current_version + 1):
+        cursor.execute('BEGIN')
+        try:
+            migration(cursor)
+            cursor.execute('PRAGMA user_version = {0}'.format(i))
+        except sqlite3.Error:
+            db_conn.rollback()
+            raise
+        db_conn.commit()
@@ -0,0 +1,232 @@
+"""Module for sending print jobs to CUPS without blocking the bot."""
+import itertools
+import queue
+import re
+import subprocess
+import sys
+import threading
+from action import ActionInputError
+
+
+class PrintJob:
+    """Print job that was handed to the spooler.
+
+    Attributes
+    ----------
+    number : int
+        Number of the job within the spooler. Users refer to the job with it.
+    user : str
+        User that sent the job.
+    filename : str
+        Name of the printed file.
+    command : list of str
+        Command that sends the file to CUPS. It must print the job id, as `lp` does.
+    speak : function
+        Function that sends a message to the user.
+    job_id : str
+        Id of the job within CUPS, once it has been sent.
+    state : {'queued', 'sending', 'printing', 'done', 'cancelled', 'failed'}
+        State of the job.
+
+    """
+    def __init__(self, number, user, filename, command, speak=None):
+        self.number = number
+        self.user = user
+        self.filename = filename
+        self.command = command
+        self.speak = speak
+        self.job_id = None
+        self.state = 'queued'
+
+    def notify(self, message):
+        """Send a message to the user that sent the job."""
+        if self.speak is not None:
+            self.speak(message)
+        else:
+            print(message, file=sys.stderr)
+
+    def __str__(self):
+        return '{0}: {1} from {2} ({3})'.format(self.number, self.filename, self.user, self.state)
+
+
+class Spooler:
+    """Bounded queue of print jobs with a worker that submits them and a poller that tracks them.
+
+    Attributes
+    ----------
+    max_jobs : int
+        Largest number of jobs that can wait to be sent to CUPS.
+    poll_interval : float
+        Number of seconds between checks of the jobs that are printing.
+    lpstat : list of str
+        Command that lists the jobs that are not completed, one per line, starting with the job id.
+    cancel_command : list of str
+        Command that cancels the job whose id is appended to it.
+    timeout : float
+        Number of seconds after which a CUPS command is given up on.
+    jobs : dict of int to PrintJob
+        Jobs that are queued or printing.
+
+    """
+    def __init__(self, max_jobs=10, poll_interval=5.0,
+                 lpstat=('lpstat', '-W', 'not-completed', '-o'), cancel_command=('cancel',),
+                 timeout=30.0):
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval
+        self.lpstat = list(lpstat)
+        self.cancel_command = list(cancel_command)
+        self.timeout = timeout
+        self.jobs = {}
+        self._numbers = itertools.count(1)
+        self._queue = queue.Queue(maxsize=max_jobs)
+        self._lock = threading.Lock()
+        self._wake_poller = threading.Event()
+        self._threads = []
+
+    def _start(self):
+        """Start the worker and the poller if they are not running yet."""
+        if not self._threads:
+            for target, name in [(self._work, 'print_worker'), (self._poll, 'print_poller')]:
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self, command):
+        """Run a CUPS command and return its output."""
+        return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, timeout=self.timeout, check=True).stdout
+
+    def submit(self, user, filename, command, speak=None):
+        """Queue a print job.
+
+        Parameters
+        ----------
+        user : str
+            User that sends the job.
+        filename : str
+            Name of the printed file.
+        command : list of str
+            Command that sends the file to CUPS and prints the job id.
+        speak : function
+            Function that sends a message to the user.
+
+        Returns
+        -------
+        job : PrintJob
+            Queued job.
+
+        Raises
+        ------
+        ActionInputError
+            If too many jobs are waiting already.
+
+        """
+        with self._lock:
+            self._start()
+            job = PrintJob(next(self._numbers), user, filename, command, speak)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise ActionInputError('There are already {0} jobs waiting for the printer. Try '
+                                       'again later.'.format(self.max_jobs))
+            self.jobs[job.number] = job
+        return job
+
+    def status(self):
+        """Return a message that describes the jobs that are queued or printing."""
+        with self._lock:
+            jobs = sorted(self.jobs.values(), key=lambda job: job.number)
+        if not jobs:
+            return 'There are no print jobs.'
+        return '\n'.join(str(job) for job in jobs)
+
+    def cancel(self, user, number):
+        """Cancel a print job.
+
+        Parameters
+        ----------
+        user : str
+            User that wants to cancel the job. Only the user that sent the job can cancel it.
+        number : str
+            Number of the job within the spooler, or its id within CUPS.
+
+        Raises
+        ------
+        ActionInputError
+            If the job cannot be found or cancelled.
+
+        """
+        with self._lock:
+            matches = [job for job in self.jobs.values() if number in (str(job.number), job.job_id)]
+            if not matches:
+                raise ActionInputError('I could not find the print job, {0}.'.format(number))
+            job = matches[0]
+            if job.user != user:
+                raise ActionInputError('Only {0} can cancel the print job, {1}.'
+                                       ''.format(job.user, number))
+            if job.state == 'queued':
+                job.state = 'cancelled'
+                del self.jobs[job.number]
+                return
+            elif job.state == 'sending':
+                raise ActionInputError('The print job, {0}, is being sent to the printer. Try again'
+                                       ' in a moment.'.format(number))
+        try:
+            self._run(self.cancel_command + [job.job_id])
+        except (OSError, subprocess.SubprocessError) as error:
+            raise ActionInputError('I could not cancel the print job, {0}: {1}'
+                                   ''.format(number, error))
+        with self._lock:
+            job.state = 'cancelled'
+            self.jobs.pop(job.number, None)
+
+    def _work(self):
+        """Send the queued jobs to CUPS one at a time."""
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.state == 'cancelled':
+                    continue
+                job.state = 'sending'
+            try:
+                output = self._run(job.command)
+                job_id = re.search(r'request id is (\S+)', output).group(1)
+            except (OSError, subprocess.SubprocessError, AttributeError) as error:
+                with self._lock:
+                    job.state = 'failed'
+                    self.jobs.pop(job.number, None)
+                job.notify('I could not print {0}: {1}'.format(job.filename, error))
+                continue
+            with self._lock:
+                job.job_id = job_id
+                job.state = 'printing'
+            self._wake_poller.set()
+
+    def _poll(self):
+        """Check which jobs are done and tell the users that sent them."""
+        while True:
+            self._wake_poller.wait()
+            self._wake_poller.clear()
+            while True:
+                with self._lock:
+                    printing = [job for job in self.jobs.values() if job.state == 'printing']
+                if not printing:
+                    break
+                try:
+                    output = self._run(self.lpstat)
+                except (OSError, subprocess.SubprocessError) as error:
+                    print('Could not check the print jobs: {0}'.format(error), file=sys.stderr)
+                else:
+                    not_completed = {line.split()[0] for line in output.splitlines()
+                                     if line.strip()}
+                    for job in printing:
+                        if job.job_id in not_completed:
+                            continue
+                        with self._lock:
+                            if job.state != 'printing':
+                                continue
+                            job.state = 'done'
+                            self.jobs.pop(job.number, None)
+                        job.notify('{0} has been printed.'.format(job.filename))
+                self._wake_poller.wait(self.poll_interval)
+                self._wake_poller.clear()
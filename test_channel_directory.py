@@ -0,0 +1,36 @@
+"""Tests for channel_directory.ChannelDirectory."""
+import pytest
+from channel_directory import ChannelDirectory
+
+
+class FlakySlackClient:
+    """Slack client that cannot be reached for the given number of calls."""
+    def __init__(self, failures):
+        self.failures = failures
+
+    def api_call(self, method, **kwargs):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError('Slack is down.')
+        return {'channels': [{'name': 'shush', 'id': 'C1'}], 'groups': [], 'ims': []}
+
+
+def test_failed_first_fetch_is_retried_soon():
+    """A failed first fetch is not taken as loaded, and is tried again well before `ttl`."""
+    directory = ChannelDirectory(FlakySlackClient(2), ttl=300.0, retry_delay=0.01,
+                                 load_timeout=5.0)
+    try:
+        assert directory.id('shush') == 'C1'
+    finally:
+        directory.close()
+
+
+def test_lookup_fails_if_channels_never_load():
+    """Lookups fail loudly, instead of finding nothing, when Slack cannot be reached."""
+    directory = ChannelDirectory(FlakySlackClient(10**6), ttl=300.0, retry_delay=0.01,
+                                 load_timeout=0.1)
+    try:
+        with pytest.raises(RuntimeError):
+            directory.id('shush')
+    finally:
+        directory.close()
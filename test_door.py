@@ -0,0 +1,43 @@
+"""Benchmark of the permission check of door.open_door."""
+import sqlite3
+import timeit
+import door
+import schema
+from member_directory import directory
+
+
+def members_db(n_members):
+    """Return a database with the given number of members, half of whom can open the door."""
+    db_conn = sqlite3.connect(':memory:')
+    schema.migrate(db_conn)
+    db_conn.executemany('INSERT INTO members (name, userid, slack_id, door_permission) '
+                        'VALUES (?,?,?,?)',
+                        (('Member {0}'.format(i), 'user{0}'.format(i), 'U{0}'.format(i),
+                          'yesdoor' if i % 2 == 0 else 'nodoor')
+                         for i in range(n_members)))
+    db_conn.commit()
+    return db_conn
+
+
+def time_check(n_members, n_checks=20000):
+    """Return the number of seconds that the given number of door checks take."""
+    db_conn = members_db(n_members)
+    cursor = db_conn.cursor()
+    directory.load(cursor)
+    users = ['user{0}'.format(i % n_members) for i in range(n_checks)]
+    assert door.has_permission(cursor, 'user0')
+    assert not door.has_permission(cursor, 'U1')
+    try:
+        return min(timeit.repeat(lambda: [door.has_permission(cursor, i) for i in users],
+                                 number=1, repeat=5))
+    finally:
+        directory.invalidate()
+
+
+def test_door_check_stays_flat_as_members_grow():
+    """The check takes about as long with 50000 members as with 500."""
+    small = time_check(500)
+    large = time_check(50000)
+    print('door check: {0:.2f} us with 500 members, {1:.2f} us with 50000 members'
+          ''.format(small / 20000 * 1e6, large / 20000 * 1e6))
+    assert large < 5 * small
@@ -0,0 +1,96 @@
+"""Tests for executor.CommandExecutor."""
+import threading
+import time
+import pytest
+from action import ActionInputError
+from executor import CommandExecutor, Lane
+
+
+def wait_until(predicate, timeout=5.0):
+    """Wait for the predicate to hold, and fail if it does not within the timeout."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'Timed out waiting for the executor.'
+        time.sleep(0.001)
+
+
+def test_door_runs_while_other_lanes_are_saturated():
+    """The door lane gets a worker while the other lanes run as many commands as they can."""
+    executor = CommandExecutor(max_workers=4, lanes=[Lane('door', 50, None),
+                                                     Lane('interactive', 20, 2),
+                                                     Lane('bulk', 5, 1)])
+    release = threading.Event()
+    door_opened = threading.Event()
+    try:
+        for i in range(3):
+            executor.submit(('c', 'bulk{0}'.format(i)), release.wait, lane='bulk')
+            executor.submit(('c', 'interactive{0}'.format(i)), release.wait, lane='interactive')
+        # wait until the other lanes run as many commands as they can
+        wait_until(lambda: (executor.stats()['interactive']['running'] == 2 and
+                            executor.stats()['bulk']['running'] == 1))
+        executor.submit(('c', 'door'), door_opened.set, lane='door')
+        assert door_opened.wait(5)
+        stats = executor.stats()
+        assert stats['interactive']['running'] == 2
+        assert stats['bulk']['running'] == 1
+    finally:
+        release.set()
+        executor.close()
+
+
+def test_lanes_must_leave_a_worker_for_the_first_lane():
+    """Lanes that could take every worker are refused."""
+    with pytest.raises(ValueError):
+        CommandExecutor(max_workers=4, lanes=[Lane('door', 50, None), Lane('interactive', 20, 3),
+                                              Lane('bulk', 5, 2)])
+    with pytest.raises(ValueError):
+        CommandExecutor(max_workers=4, lanes=[Lane('door', 50, None), Lane('bulk', 5, None)])
+
+
+def test_full_lane_is_shed():
+    """Commands beyond the size of a lane are turned away."""
+    executor = CommandExecutor(max_workers=2, lanes=[Lane('door', 5, None), Lane('bulk', 1, 1)])
+    release = threading.Event()
+    try:
+        executor.submit(('c', 'a'), release.wait, lane='bulk')
+        # wait for the first command to start, so that the second one is the only one queued
+        wait_until(lambda: executor.stats()['bulk']['running'] == 1)
+        executor.submit(('c', 'b'), release.wait, lane='bulk')
+        with pytest.raises(ActionInputError):
+            executor.submit(('c', 'c'), release.wait, lane='bulk')
+    finally:
+        release.set()
+        executor.close()
+
+
+def test_commands_with_the_same_key_run_in_order():
+    """Commands of the same user run one at a time, in the order they were submitted."""
+    executor = CommandExecutor(max_workers=4)
+    order = []
+    try:
+        for i in range(20):
+            executor.submit(('c', 'u'), lambda i=i: order.append(i))
+    finally:
+        executor.close()
+    assert order == list(range(20))
+
+
+def test_timeouts_are_watched_by_one_thread():
+    """Commands that time out are given up on, without a thread for each command."""
+    executor = CommandExecutor(max_workers=2, timeout=0.05)
+    release = threading.Event()
+    timed_out = threading.Event()
+    finished = []
+    try:
+        executor.submit(('c', 'slow'), release.wait, on_timeout=timed_out.set)
+        # the next command of the same user starts once the slow one is given up on
+        executor.submit(('c', 'slow'), lambda: finished.append('next'))
+        for i in range(50):
+            executor.submit(('c', i), lambda: finished.append('fast'))
+        assert timed_out.wait(5)
+        wait_until(lambda: len(finished) == 51)
+        # the workers and the watchdog
+        assert len([i for i in threading.enumerate() if i.name.startswith('command_')]) == 3
+    finally:
+        release.set()
+        executor.close()
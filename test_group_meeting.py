@@ -0,0 +1,76 @@
+"""Tests and benchmark of bot.group_meeting.GroupMeeting.select_member_random."""
+from datetime import date, datetime, timedelta
+import random
+import sqlite3
+import timeit
+import pytest
+import schema
+
+group_meeting = pytest.importorskip('bot.group_meeting')
+
+
+def meetings_db(n_members=3000, n_years=8):
+    """Return a database with the given number of members and years of weekly meetings."""
+    db_conn = sqlite3.connect(':memory:')
+    schema.migrate(db_conn)
+    db_conn.executemany('INSERT INTO members (name, userid) VALUES (?,?)',
+                        (('Member {0}'.format(i), 'user{0}'.format(i))
+                         for i in range(n_members)))
+    picker = random.Random(0)
+    first = date(2017, 1, 2)
+    db_conn.executemany('INSERT INTO group_meetings (date, presenter, chair) VALUES (?,?,?)',
+                        (((first + timedelta(weeks=i)).isoformat(),
+                          picker.randint(1, n_members), picker.randint(1, n_members))
+                         for i in range(52 * n_years)))
+    db_conn.commit()
+    return db_conn
+
+
+def time_since_last_per_member(cursor, date_obj, job):
+    """Find the days since each member last had the job with one query per member.
+
+    This is how `select_member_random` used to do it, and is only kept to compare against.
+
+    """
+    time_since_last = []
+    for member_id, in cursor.execute('SELECT id FROM members ORDER BY id').fetchall():
+        cursor.execute('SELECT * FROM group_meetings WHERE {0}=? ORDER BY date DESC'.format(job),
+                       (member_id, ))
+        last_date = cursor.fetchone()
+        if last_date in [None, '']:
+            last_date = datetime.min.date()
+        else:
+            last_date = datetime.strptime(last_date[1], '%Y-%m-%d').date()
+        time_since_last.append((date_obj - last_date).days)
+    time_since_last = [i if i > 27 else 0 for i in time_since_last]
+    probs = [weight * random.random() for weight in time_since_last]
+    probs = [prob / sum(probs) for prob in probs]
+    return probs.index(max(probs))
+
+
+def test_seeded_selections_are_repeatable():
+    """Two group meetings with the same seed select the same members."""
+    db_conn = meetings_db(n_members=200, n_years=2)
+    day = date(2019, 6, 3)
+    picks = []
+    for _ in range(2):
+        meeting = group_meeting.GroupMeeting(db_conn, seed=42)
+        picks.append([meeting.select_member_random(day, job)
+                      for job in ['presenter', 'chair'] * 10])
+    assert picks[0] == picks[1]
+    assert len(set(picks[0])) > 1
+
+
+def test_selection_is_faster_than_one_query_per_member():
+    """Selecting among thousands of members with years of meetings beats the old way."""
+    db_conn = meetings_db()
+    meeting = group_meeting.GroupMeeting(db_conn, seed=0)
+    day = date(2025, 1, 6)
+    new = min(timeit.repeat(lambda: meeting.select_member_random(day, 'presenter'),
+                            number=1, repeat=5))
+    old = min(timeit.repeat(lambda: time_since_last_per_member(db_conn.cursor(), day,
+                                                               'presenter'),
+                            number=1, repeat=1))
+    print('select_member_random: {0:.1f} ms, one query per member: {1:.1f} ms'
+          ''.format(new * 1e3, old * 1e3))
+    assert new < old
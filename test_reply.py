@@ -0,0 +1,18 @@
+"""Tests for reply.split."""
+import pytest
+from reply import split
+
+
+@pytest.mark.parametrize('text', ['\n' + 'x' * 10, 'x' * 10 + '\n', 'x' * 10 + '\n\n',
+                                  '\n' + 'x' * 10 + '\n', 'x' * 25 + '\n', '\n\n\n'])
+def test_no_empty_parts(text):
+    """Line breaks around a line of exactly the limit do not make empty parts."""
+    parts = split(text, 10)
+    assert all(part.strip() for part in parts)
+    assert all(len(part) <= 10 for part in parts)
+    assert ''.join(parts).replace('\n', '') == text.replace('\n', '')
+
+
+def test_lines_are_kept_together():
+    """Lines are only broken when they are longer than the limit."""
+    assert split('ab\ncd\nefghijklmnop', 5) == ['ab\ncd', 'efghi', 'jklmn', 'op']
@@ -0,0 +1,36 @@
+"""Tests for schema.migrate."""
+import sqlite3
+import pytest
+import schema
+
+
+def baseline_db():
+    """Return a database as the bot made it before the migrations existed."""
+    db_conn = sqlite3.connect(':memory:')
+    schema.create_tables(db_conn.cursor())
+    db_conn.commit()
+    return db_conn
+
+
+def test_members_without_userid_or_with_the_same_name_are_migrated():
+    """Members that were added with a blank userid, or that share a name, do not stop the upgrade."""
+    db_conn = baseline_db()
+    db_conn.executemany('INSERT INTO members (name, userid, slack_id) VALUES (?,?,?)',
+                        [('John Smith', '', ''), ('John Smith', '', ''), ('Jane Doe', 'jd', 'U1')])
+    db_conn.commit()
+    schema.migrate(db_conn)
+    assert schema.version(db_conn) == len(schema.migrations)
+    assert db_conn.execute('SELECT COUNT(*) FROM members').fetchone()[0] == 3
+
+    # members without a userid can still be added, but a userid can only be used once
+    db_conn.execute("INSERT INTO members (name, userid) VALUES ('Someone Else', '')")
+    with pytest.raises(sqlite3.IntegrityError):
+        db_conn.execute("INSERT INTO members (name, userid) VALUES ('Jane Roe', 'jd')")
+
+
+def test_migrate_is_idempotent():
+    """Migrating a database that is up to date does nothing."""
+    db_conn = baseline_db()
+    schema.migrate(db_conn)
+    schema.migrate(db_conn)
+    assert schema.version(db_conn) == len(schema.migrations)
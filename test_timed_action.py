@@ -0,0 +1,20 @@
+"""Tests for bot.timed_action.Job."""
+import pytest
+
+timed_action = pytest.importorskip('bot.timed_action')
+
+
+@pytest.mark.parametrize('now, next_time', [(105, 110), (110, 120), (115, 120), (130, 140),
+                                            (131, 140)])
+def test_skip_policy_runs_next_in_the_future(now, next_time):
+    """A late job that skips its missed runs is next due after now, on its schedule."""
+    job = timed_action.Job('key', None, 10, next_time=100)
+    job.reschedule(now)
+    assert job.next_time == next_time
+
+
+def test_catch_up_policy_runs_every_missed_run():
+    """A late job that catches up is next due one interval after the run that was due."""
+    job = timed_action.Job('key', None, 10, next_time=100, policy='catch_up')
+    job.reschedule(130)
+    assert job.next_time == 110
@@ -0,0 +1,167 @@
+"""Content-addressed store of the uploaded files."""
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class UploadCache:
+    """Directory of uploaded files that are stored under the hash of their contents.
+
+    Each file is stored once, no matter how many times or under how many names it was uploaded. An
+    index from the filename to the hash finds the file of a name in constant time. When the files
+    take more space than `max_size`, the least recently used ones are deleted.
+
+    The index is kept in `index.json` within the directory, so it survives restarts of the bot.
+
+    Attributes
+    ----------
+    directory : str
+        Directory in which the files are stored.
+    max_size : int
+        Largest total number of bytes of the stored files.
+    names : dict of str to str
+        Dictionary of the filename to the hash of the file.
+    files : collections.OrderedDict of str to dict
+        Dictionary of the hash to the size, extension, and time of last use of each file, from the
+        least to the most recently used.
+
+    """
+    def __init__(self, directory, max_size=500 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.names = {}
+        self.files = collections.OrderedDict()
+        self._is_loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def index_path(self):
+        """Path to the index of the cache."""
+        return os.path.join(self.directory, 'index.json')
+
+    @property
+    def size(self):
+        """Total number of bytes of the stored files."""
+        with self._lock:
+            self._load()
+            return sum(i['size'] for i in self.files.values())
+
+    def _path(self, file_hash):
+        """Return the path to the file with the given hash."""
+        return os.path.join(self.directory, file_hash + self.files[file_hash]['extension'])
+
+    def _load(self):
+        """Read the index from the directory, if it has not been read yet."""
+        if self._is_loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self.index_path) as fh:
+                index = json.load(fh)
+        except (OSError, ValueError):
+            index = {'names': {}, 'files': []}
+        self.files = collections.OrderedDict(
+            (i['hash'], i) for i in sorted(index['files'], key=lambda i: i['last_used'])
+            if os.path.exists(os.path.join(self.directory, i['hash'] + i['extension']))
+        )
+        self.names = {i: j for i, j in index['names'].items() if j in self.files}
+        self._is_loaded = True
+
+    def _save(self):
+        """Write the index into the directory, replacing the old one at once."""
+        index = {'names': self.names, 'files': list(self.files.values())}
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.index-')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(index, fh)
+        os.replace(temp_path, self.index_path)
+
+    def _touch(self, file_hash):
+        """Mark the file with the given hash as the most recently used."""
+        self.files[file_hash]['last_used'] = time.time()
+        self.files.move_to_end(file_hash)
+
+    def _remove(self, file_hash):
+        """Delete the file with the given hash and the names that refer to it."""
+        try:
+            os.remove(self._path(file_hash))
+        except FileNotFoundError:
+            pass
+        del self.files[file_hash]
+        for name in [i for i, j in self.names.items() if j == file_hash]:
+            del self.names[name]
+
+    def _evict(self):
+        """Delete the least recently used files until the cache fits within its size."""
+        total = sum(i['size'] for i in self.files.values())
+        # the most recently used file is always kept
+        while total > self.max_size and len(self.files) > 1:
+            file_hash = next(iter(self.files))
+            total -= self.files[file_hash]['size']
+            self._remove(file_hash)
+
+    def path(self, filename):
+        """Return the path to the file that was uploaded with the given name, or None."""
+        with self._lock:
+            self._load()
+            file_hash = self.names.get(filename)
+            if file_hash is None:
+                return None
+            self._touch(file_hash)
+            self._save()
+            return self._path(file_hash)
+
+    def temp_path(self):
+        """Return a path in the directory of the cache to which a file can be downloaded."""
+        with self._lock:
+            self._load()
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.upload-')
+        os.close(fd)
+        return temp_path
+
+    def add(self, filename, source):
+        """Move a file into the cache under the given name.
+
+        If a file with the same contents is already stored, the given file is deleted instead. The
+        name then refers to the stored file.
+
+        Parameters
+        ----------
+        filename : str
+            Name under which the file was uploaded.
+        source : str
+            Path to the file. It should be on the same file system as the cache.
+
+        Returns
+        -------
+        path : str
+            Path to the stored file.
+
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        with open(source, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(64 * 1024), b''):
+                hasher.update(chunk)
+                size += len(chunk)
+        file_hash = hasher.hexdigest()
+
+        with self._lock:
+            self._load()
+            if file_hash in self.files:
+                os.remove(source)
+            else:
+                self.files[file_hash] = {'hash': file_hash, 'size': size,
+                                         'extension': os.path.splitext(filename)[-1].lower()}
+                os.replace(source, self._path(file_hash))
+            old_hash = self.names.get(filename)
+            self.names[filename] = file_hash
+            if old_hash not in (None, file_hash) and old_hash not in self.names.values():
+                self._remove(old_hash)
+            self._touch(file_hash)
+            self._evict()
+            self._save()
+            return self._path(file_hash)
@@ -64,7 +64,7 @@ def make_errors(actions, speaker):
     """Add the 'error' and appropriate message each level that does not have the 'error' key."""
 
     if isinstance(actions, dict):
-        keys = [key for key in actions.keys() if key != 'error']
+        keys = [key for key in actions.keys() if key not in ['error', None]]
 
         actions.setdefault('error',
                            'The last keyword must be one of {0}.'